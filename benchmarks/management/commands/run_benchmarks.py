@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.runner import compare_reports, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and p50/p95/p99 latency of the hot endpoints and write a JSON report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--users', type=int, default=20, help="Seeded users to sample requests from.")
+        parser.add_argument('--output', default='benchmark_report.json')
+        parser.add_argument('--compare', help="Previous report to check for latency regressions.")
+        parser.add_argument('--threshold', type=float, default=0.1, help="Allowed slowdown before flagging.")
+
+    def handle(self, *args, **options):
+        report = run_benchmarks(
+            requests_per_endpoint=options['requests'],
+            concurrency=options['concurrency'],
+            sample_users=options['users'],
+        )
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:16} {stats['throughput_rps']:>9} rps  p50 {stats['p50_ms']:>8} ms  "
+                f"p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  queries {stats['mean_queries']}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            regressions = compare_reports(previous, report, options['threshold'])
+            for endpoint, metric, old, new in regressions:
+                self.stdout.write(self.style.ERROR(f"{endpoint} {metric}: {old} ms -> {new} ms"))
+            if regressions:
+                raise SystemExit(1)
+
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
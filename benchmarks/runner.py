@@ -0,0 +1,145 @@
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chat.models import DirectMessage, Group
+from narma.instrumentation import collect_metrics
+from posts.models import Comment, Post
+from .seed import USERNAME_PREFIX
+
+User = get_user_model()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def hot_targets(sample_users):
+    """Pick a mix of the busiest and ordinary seeded users and the URLs each endpoint is hit with."""
+    bench_users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    users = list(
+        bench_users.annotate(friend_count=Count('friends')).order_by('-friend_count')[:sample_users // 2]
+    ) + list(bench_users.order_by('?')[:sample_users - sample_users // 2])
+
+    hot_post_ids = list(
+        Comment.objects.filter(post__visibility='public')
+        .values('post').annotate(total=Count('id')).order_by('-total')
+        .values_list('post', flat=True)[:50]
+    )
+
+    targets = []
+    for user in users:
+        urls = {
+            'posts': '/posts/',
+            'friends': '/friends/',
+            'friend_requests': '/friend_requests/',
+        }
+        if hot_post_ids:
+            urls['post_comments'] = f'/posts/{hot_post_ids[user.id % len(hot_post_ids)]}/comments/'
+        message = DirectMessage.objects.filter(sender=user).select_related('recipient').first()
+        if message:
+            urls['dm'] = f'/dm/{message.recipient.username}/'
+        group_id = Group.objects.filter(members=user).values_list('id', flat=True).first()
+        if group_id:
+            urls['group_messages'] = f'/groups/{group_id}/messages/'
+        token = str(RefreshToken.for_user(user).access_token)
+        targets.append((token, urls))
+    return targets
+
+
+def _hit(token, url):
+    client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+    with collect_metrics() as metrics:
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+    return response.status_code, elapsed, metrics.query_count
+
+
+def _hit_all(calls):
+    try:
+        return [_hit(*call) for call in calls]
+    finally:
+        # Worker threads open their own DB connections.
+        connections.close_all()
+
+
+def run_benchmarks(requests_per_endpoint=200, concurrency=1, sample_users=20):
+    targets = hot_targets(sample_users)
+    endpoints = sorted({name for _, urls in targets for name in urls})
+    results = {}
+
+    # Benchmarks measure the app, not the rate limiter.
+    with mock.patch.object(APIView, 'get_throttles', return_value=[]):
+        for endpoint in endpoints:
+            calls = [
+                (token, urls[endpoint])
+                for token, urls in targets if endpoint in urls
+            ]
+            calls = [calls[i % len(calls)] for i in range(requests_per_endpoint)]
+            _hit(*calls[0])
+
+            start = time.perf_counter()
+            if concurrency == 1:
+                samples = [_hit(*call) for call in calls]
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    chunks = pool.map(_hit_all, [calls[i::concurrency] for i in range(concurrency)])
+                    samples = [sample for chunk in chunks for sample in chunk]
+            wall = time.perf_counter() - start
+
+            latencies = [elapsed * 1000 for _, elapsed, _ in samples]
+            results[endpoint] = {
+                'requests': len(samples),
+                'errors': sum(1 for status, _, _ in samples if status >= 400),
+                'throughput_rps': round(len(samples) / wall, 2),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'mean_queries': round(statistics.mean(queries for _, _, queries in samples), 2),
+            }
+
+    return {
+        'commit': current_commit(),
+        'timestamp': timezone.now().isoformat(),
+        'concurrency': concurrency,
+        'dataset': {
+            'users': User.objects.filter(username__startswith=USERNAME_PREFIX).count(),
+            'posts': Post.objects.count(),
+        },
+        'endpoints': results,
+    }
+
+
+def compare_reports(previous, current, threshold=0.1):
+    """Return ``(endpoint, metric, old, new)`` for every latency that regressed by more than ``threshold``."""
+    regressions = []
+    for endpoint, stats in current['endpoints'].items():
+        old = previous.get('endpoints', {}).get(endpoint)
+        if not old:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if old[metric] and stats[metric] > old[metric] * (1 + threshold):
+                regressions.append((endpoint, metric, old[metric], stats[metric]))
+    return regressions
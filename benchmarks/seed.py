@@ -0,0 +1,225 @@
+import itertools
+import random
+from bisect import bisect_left
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db.models import CharField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, LPad
+
+from chat.models import DirectMessage, Group, GroupMessage
+from friends.models import Friend, FriendRequest
+from posts.models import Comment, Post, PostReaction
+from posts.utils import comment_count_subquery
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'bench'
+BATCH_SIZE = 5000
+
+# Row counts at --scale 1.
+FULL_SCALE = {
+    'users': 100_000,
+    'posts': 1_000_000,
+    'reactions': 10_000_000,
+    'comments': 2_000_000,
+    'direct_messages': 2_000_000,
+    'groups': 10_000,
+    'group_messages': 1_000_000,
+    'friend_requests': 200_000,
+}
+
+SPREAD_CREATED_AT = RawSQL("now() - random() * interval '365 days'", [])
+
+
+def scaled_counts(scale):
+    return {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+
+
+class PowerLawSampler:
+    """Draws ids with Pareto-distributed weights, so a few users dominate activity like in a real network."""
+
+    def __init__(self, rng, ids, alpha=1.2):
+        self.rng = rng
+        self.ids = ids
+        self.cum_weights = list(itertools.accumulate(rng.paretovariate(alpha) for _ in ids))
+
+    def choice(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return self.ids[bisect_left(self.cum_weights, point)]
+
+    def sample(self, k):
+        return {self.choice() for _ in range(k)}
+
+
+def _batched(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _bulk_insert(model, objects):
+    total = 0
+    for batch in _batched(objects):
+        model.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+        total += len(batch)
+    return total
+
+
+class Seeder:
+    def __init__(self, scale=0.01, seed=42, log=print):
+        self.counts = scaled_counts(scale)
+        self.rng = random.Random(seed)
+        self.log = log
+
+    def run(self):
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise RuntimeError("Benchmark data already exists; drop the database before seeding again.")
+
+        user_ids = self.seed_users()
+        users = PowerLawSampler(self.rng, user_ids)
+        friend_pairs = self.seed_friends(user_ids, users)
+        self.seed_friend_requests(users, friend_pairs)
+        post_ids = self.seed_posts(users)
+        self.seed_comments(post_ids, users)
+        self.seed_direct_messages(friend_pairs)
+        self.seed_groups(users)
+        return self.counts
+
+    def seed_users(self):
+        password = make_password('benchmark')
+        users = (
+            User(
+                username=f'{USERNAME_PREFIX}{i}',
+                email=f'{USERNAME_PREFIX}{i}@example.com',
+                password=password,
+                is_active=True,
+            )
+            for i in range(self.counts['users'])
+        )
+        self.log(f"users: {_bulk_insert(User, users)}")
+        return list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').values_list('id', flat=True)
+        )
+
+    def seed_friends(self, user_ids, users):
+        pairs = set()
+        average_degree = 20
+        for user_id in user_ids:
+            degree = min(int(self.rng.paretovariate(1.5) * average_degree / 3), 2000)
+            for friend_id in users.sample(degree):
+                if friend_id != user_id:
+                    pairs.add((min(user_id, friend_id), max(user_id, friend_id)))
+
+        rows = itertools.chain.from_iterable(
+            (Friend(user_id=a, friend_id=b), Friend(user_id=b, friend_id=a)) for a, b in pairs
+        )
+        self.log(f"friend rows: {_bulk_insert(Friend, rows)}")
+        return sorted(pairs)
+
+    def seed_friend_requests(self, users, friend_pairs):
+        friends = set(friend_pairs)
+        requests = set()
+        for _ in range(self.counts['friend_requests'] * 10):
+            if len(requests) >= self.counts['friend_requests']:
+                break
+            from_id, to_id = users.choice(), users.choice()
+            if from_id != to_id and (min(from_id, to_id), max(from_id, to_id)) not in friends:
+                requests.add((from_id, to_id))
+        rows = (FriendRequest(from_user_id=a, to_user_id=b) for a, b in requests)
+        self.log(f"friend requests: {_bulk_insert(FriendRequest, rows)}")
+
+    def seed_posts(self, users):
+        reactions_per_post = self.counts['reactions'] / self.counts['posts']
+        user_ids = users.ids
+        post_total = reaction_total = 0
+        for batch_size in self._chunks(self.counts['posts']):
+            posts, reactions = [], []
+            for _ in range(batch_size):
+                visibility = self.rng.choices(['public', 'friends', 'private'], weights=[6, 3, 1])[0]
+                count = min(int(self.rng.paretovariate(1.5) * reactions_per_post / 3), len(user_ids))
+                reactors = self.rng.sample(user_ids, count)
+                kinds = [self.rng.choices(['like', 'dislike'], weights=[4, 1])[0] for _ in reactors]
+                posts.append(Post(
+                    author_id=users.choice(),
+                    title='Benchmark post',
+                    description='Seeded for benchmarks.',
+                    visibility=visibility,
+                    likes_count=kinds.count('like'),
+                    dislikes_count=kinds.count('dislike'),
+                ))
+                reactions.append(list(zip(reactors, kinds)))
+
+            Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+            rows = (
+                PostReaction(post_id=post.id, user_id=user_id, reaction=kind)
+                for post, post_reactions in zip(posts, reactions)
+                for user_id, kind in post_reactions
+            )
+            reaction_total += _bulk_insert(PostReaction, rows)
+            post_total += len(posts)
+
+        Post.objects.filter(author__username__startswith=USERNAME_PREFIX).update(created_at=SPREAD_CREATED_AT)
+        self.log(f"posts: {post_total}, reactions: {reaction_total}")
+        return list(
+            Post.objects.filter(author__username__startswith=USERNAME_PREFIX).values_list('id', flat=True)
+        )
+
+    def seed_comments(self, post_ids, users):
+        posts = PowerLawSampler(self.rng, post_ids)
+        rows = (
+            Comment(post_id=posts.choice(), author_id=users.choice(), text='Benchmark comment')
+            for _ in range(self.counts['comments'])
+        )
+        self.log(f"comments: {_bulk_insert(Comment, rows)}")
+        Comment.objects.filter(author__username__startswith=USERNAME_PREFIX).update(
+            created_at=SPREAD_CREATED_AT,
+            path=LPad(Cast('id', CharField()), Comment.PATH_SEGMENT_WIDTH, Value('0')),
+        )
+        Post.objects.filter(author__username__startswith=USERNAME_PREFIX).update(comments_count=comment_count_subquery())
+
+    def seed_direct_messages(self, friend_pairs):
+        conversations = PowerLawSampler(self.rng, friend_pairs)
+
+        def rows():
+            for _ in range(self.counts['direct_messages']):
+                a, b = conversations.choice()
+                sender, recipient = (a, b) if self.rng.random() < 0.5 else (b, a)
+                yield DirectMessage(sender_id=sender, recipient_id=recipient, message='Benchmark message')
+
+        self.log(f"direct messages: {_bulk_insert(DirectMessage, rows())}")
+        DirectMessage.objects.filter(
+            sender__username__startswith=USERNAME_PREFIX
+        ).update(created_at=SPREAD_CREATED_AT)
+
+    def seed_groups(self, users):
+        groups = Group.objects.bulk_create(
+            [Group(name=f'Benchmark group {i}', owner_id=users.choice()) for i in range(self.counts['groups'])],
+            batch_size=BATCH_SIZE,
+        )
+        Membership = Group.members.through
+        members_by_group = {}
+        memberships = []
+        for group in groups:
+            members = users.sample(9) | {group.owner_id}
+            members_by_group[group.id] = list(members)
+            memberships.extend(Membership(group_id=group.id, user_id=user_id) for user_id in members)
+        _bulk_insert(Membership, memberships)
+
+        hot_groups = PowerLawSampler(self.rng, [group.id for group in groups])
+
+        def rows():
+            for _ in range(self.counts['group_messages']):
+                group_id = hot_groups.choice()
+                sender = self.rng.choice(members_by_group[group_id])
+                yield GroupMessage(group_id=group_id, sender_id=sender, content='Benchmark group message')
+
+        self.log(f"groups: {len(groups)}, group messages: {_bulk_insert(GroupMessage, rows())}")
+        GroupMessage.objects.filter(group__name__startswith='Benchmark group').update(created_at=SPREAD_CREATED_AT)
+
+    def _chunks(self, total):
+        while total > 0:
+            size = min(BATCH_SIZE, total)
+            yield size
+            total -= size
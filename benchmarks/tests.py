@@ -0,0 +1,31 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from posts.models import Post, PostReaction
+from .runner import compare_reports, run_benchmarks
+from .seed import Seeder
+
+
+class BenchmarkHarnessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Seeder(scale=0.0002, seed=1, log=lambda message: None).run()
+        cache.clear()
+
+    def test_seeded_reaction_counters_match_reactions(self):
+        post = Post.objects.filter(likes_count__gt=0).first()
+        self.assertEqual(post.likes_count, PostReaction.objects.filter(post=post, reaction='like').count())
+
+    def test_report_covers_hot_endpoints(self):
+        report = run_benchmarks(requests_per_endpoint=3, sample_users=4)
+        self.assertIn('posts', report['endpoints'])
+        self.assertIn('friends', report['endpoints'])
+        for stats in report['endpoints'].values():
+            self.assertEqual(stats['requests'], 3)
+            self.assertEqual(stats['errors'], 0)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+        slower = {'endpoints': {'posts': {'p50_ms': 1, 'p95_ms': 1, 'p99_ms': 1}}}
+        faster = {'endpoints': {'posts': {'p50_ms': 100, 'p95_ms': 100, 'p99_ms': 100}}}
+        self.assertEqual(len(compare_reports(faster, slower)), 0)
+        self.assertEqual(len(compare_reports(slower, faster)), 3)
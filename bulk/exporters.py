@@ -0,0 +1,59 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from chat.models import DirectMessage, GroupMessage
+from posts.models import Comment, Post, PostReaction
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_user_records(user):
+    """Yield ``user``'s posts, comments, reactions and chat messages as dicts.
+
+    Posts and chat messages are in the format ``import_records`` reads. Comments and reactions are export-only: they
+    point at posts by their id in this database, which an import does not keep, so ``import_records`` rejects them.
+
+    Every query runs through ``.iterator()`` (a server-side cursor on Postgres), so memory stays flat however much
+    history the user has.
+    """
+    posts = Post.objects.filter(author=user).order_by('pk').values(
+        'pk', 'title', 'description', 'visibility', 'likes_count', 'dislikes_count', 'comments_count', 'created_at',
+    )
+    for row in posts.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'post', 'id': row.pop('pk'), 'author': user.username, **row}
+
+    comments = Comment.objects.filter(author=user).order_by('pk').values('pk', 'post_id', 'parent_id', 'text', 'created_at')
+    for row in comments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'comment', 'id': row['pk'], 'post': row['post_id'], 'parent': row['parent_id'],
+            'author': user.username, 'text': row['text'], 'created_at': row['created_at'],
+        }
+
+    reactions = PostReaction.objects.filter(user=user).order_by('pk').values('post_id', 'reaction', 'created_at')
+    for row in reactions.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'reaction', 'post': row['post_id'], 'user': user.username, 'reaction': row['reaction'], 'created_at': row['created_at']}
+
+    direct_messages = (
+        DirectMessage.objects.filter(Q(sender=user) | Q(recipient=user))
+        .order_by('pk')
+        .values('pk', 'sender__username', 'recipient__username', 'message', 'created_at')
+    )
+    for row in direct_messages.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'direct_message', 'id': row['pk'], 'sender': row['sender__username'],
+            'recipient': row['recipient__username'], 'message': row['message'], 'created_at': row['created_at'],
+        }
+
+    group_messages = GroupMessage.objects.filter(sender=user).order_by('pk').values('pk', 'group_id', 'content', 'created_at')
+    for row in group_messages.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'group_message', 'id': row['pk'], 'group': row['group_id'], 'sender': user.username,
+            'content': row['content'], 'created_at': row['created_at'],
+        }
+
+
+def export_ndjson(user):
+    for record in export_user_records(user):
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
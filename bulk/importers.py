@@ -0,0 +1,245 @@
+import io
+import json
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chat.models import Conversation, DirectMessage, Group, GroupMessage
+from chat.utils import refresh_conversation
+from friends.models import Friend
+from narma.utils.response_cache import bump_generation
+from posts.models import Post
+from posts.timeline import drop_timelines
+
+User = get_user_model()
+
+IMPORT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+
+class RecordError(Exception):
+    pass
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_objects(model, objects):
+    """Insert unsaved ``objects`` with one Postgres COPY; unlike ``bulk_create`` their primary keys stay unset."""
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key and not field.generated]
+    buffer = io.StringIO()
+    for obj in objects:
+        buffer.write('\t'.join(_copy_value(field.get_prep_value(getattr(obj, field.attname))) for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    sql = f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            raw.copy_expert(sql, buffer)
+    return len(objects)
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = Counter()
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'error': message})
+
+    def as_dict(self):
+        errors = sorted(self.errors, key=lambda error: error['line'])
+        return {'imported': dict(self.imported), 'failed': self.failed, 'errors': errors}
+
+
+class RecordImporter:
+    """Turns NDJSON records of one ``type`` into ``model`` rows and COPYs them in batches.
+
+    ``user_fields`` maps record keys holding usernames to foreign key attnames; ``fields`` are copied as they are
+    and validated with ``clean_fields``. ``created_at`` may be given to replay history and defaults to now.
+    """
+    model = None
+    user_fields = {}
+    fields = ()
+
+    def related_ids(self, records, users):
+        return set()
+
+    def build(self, record, users, related):
+        values = {}
+        for key, attname in self.user_fields.items():
+            username = record.get(key)
+            if not isinstance(username, str) or username not in users:
+                raise RecordError(f"Unknown user in '{key}': {username!r}.")
+            values[attname] = users[username]
+        values.update({key: record[key] for key in self.fields if key in record})
+
+        obj = self.model(**values)
+        obj.created_at = record.get('created_at') or timezone.now()
+        try:
+            obj.clean_fields(exclude=[field.name for field in self.model._meta.concrete_fields if field.is_relation])
+        except ValidationError as exc:
+            raise RecordError('; '.join(f"{field}: {' '.join(messages)}" for field, messages in exc.message_dict.items()))
+        if timezone.is_naive(obj.created_at):
+            obj.created_at = timezone.make_aware(obj.created_at)
+        obj.updated_at = obj.created_at
+        return obj
+
+    def load(self, batch, result):
+        records = [record for _, record in batch]
+        usernames = {
+            record.get(key) for record in records for key in self.user_fields if isinstance(record.get(key), str)
+        }
+        users = dict(
+            User.objects.filter(username__in=usernames).values_list('username', 'id')
+        )
+        related = self.related_ids(records, users)
+
+        objects = []
+        for line_no, record in batch:
+            try:
+                objects.append(self.build(record, users, related))
+            except RecordError as exc:
+                result.fail(line_no, str(exc))
+        if objects:
+            with transaction.atomic():
+                copy_objects(self.model, objects)
+            self.after_copy(objects)
+            result.imported[self.kind] += len(objects)
+
+    def after_copy(self, objects):
+        pass
+
+    def finish(self):
+        pass
+
+
+class PostImporter(RecordImporter):
+    kind = 'post'
+    model = Post
+    user_fields = {'author': 'author_id'}
+    fields = ('title', 'description', 'visibility')
+
+    def __init__(self):
+        self.author_ids = set()
+
+    def after_copy(self, objects):
+        self.author_ids.update(obj.author_id for obj in objects)
+
+    def finish(self):
+        if not self.author_ids:
+            return
+        friend_ids = Friend.objects.filter(user_id__in=self.author_ids).values_list('friend_id', flat=True)
+        drop_timelines(self.author_ids | set(friend_ids))
+        bump_generation('posts')
+
+
+class DirectMessageImporter(RecordImporter):
+    kind = 'direct_message'
+    model = DirectMessage
+    user_fields = {'sender': 'sender_id', 'recipient': 'recipient_id'}
+    fields = ('message',)
+
+    def __init__(self):
+        self.pairs = set()
+
+    def build(self, record, users, related):
+        message = super().build(record, users, related)
+        if message.sender_id == message.recipient_id:
+            raise RecordError("Sender and recipient must be different users.")
+        return message
+
+    def after_copy(self, objects):
+        self.pairs.update(
+            (min(obj.sender_id, obj.recipient_id), max(obj.sender_id, obj.recipient_id)) for obj in objects
+        )
+
+    def finish(self):
+        # Counters are rebuilt from the stored messages, so imported history newer than a read marker is unread.
+        for low_id, high_id in self.pairs:
+            Conversation.objects.get_or_create(
+                user_low_id=low_id, user_high_id=high_id, defaults={'last_activity_at': timezone.now()},
+            )
+            refresh_conversation(User(pk=low_id), User(pk=high_id))
+
+
+class GroupMessageImporter(RecordImporter):
+    kind = 'group_message'
+    model = GroupMessage
+    user_fields = {'sender': 'sender_id'}
+    fields = ('content',)
+
+    def related_ids(self, records, users):
+        """Existing group ids and the ``(group_id, user_id)`` memberships among the batch's groups and senders."""
+        group_ids = {record.get('group') for record in records if isinstance(record.get('group'), int)}
+        memberships = Group.members.through.objects.filter(group_id__in=group_ids, user_id__in=users.values())
+        return (
+            set(Group.objects.filter(pk__in=group_ids).values_list('pk', flat=True)),
+            set(memberships.values_list('group_id', 'user_id')),
+        )
+
+    def build(self, record, users, related):
+        group_ids, memberships = related
+        if not isinstance(record.get('group'), int) or record['group'] not in group_ids:
+            raise RecordError(f"Unknown group: {record.get('group')!r}.")
+        message = super().build(record, users, related)
+        if (record['group'], message.sender_id) not in memberships:
+            raise RecordError(f"'{record['sender']}' is not a member of group {record['group']}.")
+        message.group_id = record['group']
+        return message
+
+
+IMPORTERS = {importer.kind: importer for importer in (PostImporter, DirectMessageImporter, GroupMessageImporter)}
+
+
+def import_records(lines, batch_size=IMPORT_BATCH_SIZE):
+    """Import NDJSON ``lines`` (one object with a ``type`` key per line) without holding more than a batch in memory.
+
+    Invalid lines are skipped and reported with their line number; valid ones are committed batch by batch.
+    """
+    importers = {kind: importer() for kind, importer in IMPORTERS.items()}
+    pending = defaultdict(list)
+    result = ImportResult()
+
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            result.fail(line_no, "Invalid JSON.")
+            continue
+        kind = record.get('type') if isinstance(record, dict) else None
+        if not isinstance(kind, str) or kind not in importers:
+            result.fail(line_no, f"Unknown record type: {kind!r}.")
+            continue
+        pending[kind].append((line_no, record))
+        if len(pending[kind]) >= batch_size:
+            importers[kind].load(pending.pop(kind), result)
+
+    for kind, batch in pending.items():
+        importers[kind].load(batch, result)
+    for importer in importers.values():
+        importer.finish()
+    return result.as_dict()
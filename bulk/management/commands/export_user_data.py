@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from bulk.exporters import export_ndjson
+
+
+class Command(BaseCommand):
+    help = "Stream a user's posts, comments, reactions and chat messages as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', help="File to write to; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+
+        if not options['output']:
+            for line in export_ndjson(user):
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w') as output:
+            output.writelines(export_ndjson(user))
+        self.stdout.write(self.style.SUCCESS(f"Exported {user.username} to {options['output']}."))
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bulk.importers import IMPORT_BATCH_SIZE, import_records
+
+
+class Command(BaseCommand):
+    help = "Import posts, direct messages and group messages from an NDJSON file ('-' reads stdin) using COPY."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            result = import_records(sys.stdin.buffer, batch_size=options['batch_size'])
+        else:
+            try:
+                source = open(options['path'], 'rb')
+            except OSError as exc:
+                raise CommandError(str(exc))
+            with source:
+                result = import_records(source, batch_size=options['batch_size'])
+
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        imported = ', '.join(f"{count} {kind}" for kind, count in result['imported'].items()) or "nothing"
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported}; {result['failed']} line(s) rejected."))
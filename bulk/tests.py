@@ -0,0 +1,125 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from chat.models import Conversation, DirectMessage, Group, GroupMessage
+from posts.models import Comment, Post, PostReaction
+from narma.utils.search import ranked_search
+
+User = get_user_model()
+
+
+def ndjson(*records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+class BulkImportExportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='pass', is_staff=True)
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.group = Group.objects.create(name='Hikers', owner=self.alice)
+        self.group.members.add(self.alice, self.bob)
+
+    def post_import(self, body):
+        self.client.force_authenticate(self.admin)
+        return self.client.post(reverse('bulk-import-data'), data=body, content_type='application/x-ndjson')
+
+    def test_import_copies_valid_records_and_reports_rejected_lines(self):
+        body = ndjson(
+            {'type': 'post', 'author': 'alice', 'title': 'Imported', 'description': 'tab\there\nnewline \\ slash',
+             'created_at': '2020-01-02T03:04:05+00:00'},
+            {'type': 'post', 'author': 'alice', 'title': 'Friends only', 'visibility': 'friends'},
+            {'type': 'direct_message', 'sender': 'alice', 'recipient': 'bob', 'message': 'hello from the past'},
+            {'type': 'direct_message', 'sender': 'bob', 'recipient': 'alice', 'message': 'hi back'},
+            {'type': 'group_message', 'group': self.group.id, 'sender': 'bob', 'content': 'welcome'},
+            {'type': 'post', 'author': 'nobody', 'title': 'Lost'},
+            {'type': 'post', 'author': 'alice', 'title': 'Bad', 'visibility': 'everyone'},
+            {'type': 'group_message', 'group': 999999, 'sender': 'bob', 'content': 'nowhere'},
+            {'type': 'group_message', 'group': self.group.id, 'sender': 'admin', 'content': 'gatecrash'},
+            {'type': 'direct_message', 'sender': ['bob'], 'recipient': 'bob', 'message': 'self'},
+            {'type': 'poll'},
+        ) + 'not json\n\n'
+
+        response = self.post_import(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['imported'], {'post': 2, 'direct_message': 2, 'group_message': 1})
+        self.assertEqual(response.data['failed'], 7)
+        self.assertEqual([error['line'] for error in response.data['errors']], [6, 7, 8, 9, 10, 11, 12])
+        self.assertIn('visibility', response.data['errors'][1]['error'])
+        self.assertIn('not a member', response.data['errors'][3]['error'])
+
+        post = Post.objects.get(title='Imported')
+        self.assertEqual(post.description, 'tab\there\nnewline \\ slash')
+        self.assertEqual(post.created_at.year, 2020)
+        self.assertEqual(post.updated_at, post.created_at)
+        self.assertEqual(post.likes_count, 0)
+        self.assertEqual(ranked_search(Post.objects.all(), 'imported').get(), post)
+        self.assertEqual(GroupMessage.objects.get().content, 'welcome')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message.message, 'hi back')
+        self.assertEqual(conversation.unread_count_for(self.alice), 1)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
+
+    def test_import_flushes_in_batches(self):
+        records = [{'type': 'group_message', 'group': self.group.id, 'sender': 'alice', 'content': f'm{i}'} for i in range(7)]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as source:
+            source.write(ndjson(*records))
+            source.flush()
+            out = StringIO()
+            call_command('import_ndjson', source.name, '--batch-size', '3', stdout=out)
+        self.assertIn('Imported 7 group_message; 0 line(s) rejected.', out.getvalue())
+        self.assertEqual(GroupMessage.objects.count(), 7)
+
+    def test_bulk_endpoints_are_admin_only(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.post(reverse('bulk-import-data'), data='', content_type='application/x-ndjson').status_code, 403)
+        self.assertEqual(self.client.get(reverse('bulk-export', args=['alice'])).status_code, 403)
+
+    def test_export_streams_user_history_that_imports_back(self):
+        post = Post.objects.create(author=self.alice, title='Mine', description='text')
+        other = Post.objects.create(author=self.bob, title='Theirs')
+        Comment.objects.create(post=other, author=self.alice, text='nice')
+        PostReaction.objects.create(post=other, user=self.alice, reaction='like')
+        DirectMessage.objects.create(sender=self.bob, recipient=self.alice, message='ping')
+        GroupMessage.objects.create(group=self.group, sender=self.alice, content='hello group')
+        GroupMessage.objects.create(group=self.group, sender=self.bob, content='not alice')
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('bulk-export', args=['alice']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['post', 'comment', 'reaction', 'direct_message', 'group_message'],
+        )
+        self.assertEqual(records[0]['id'], post.id)
+        self.assertEqual(records[3]['sender'], 'bob')
+
+        Post.objects.all().delete()
+        DirectMessage.objects.all().delete()
+        GroupMessage.objects.all().delete()
+        result = self.post_import('\n'.join(lines)).data
+        self.assertEqual(result['imported'], {'post': 1, 'direct_message': 1, 'group_message': 1})
+        self.assertEqual(
+            [error['error'] for error in result['errors']],
+            ["Unknown record type: 'comment'.", "Unknown record type: 'reaction'."],
+        )
+        self.assertEqual(Post.objects.get().title, 'Mine')
+
+    def test_export_command_writes_ndjson(self):
+        Post.objects.create(author=self.alice, title='Mine')
+        out = StringIO()
+        call_command('export_user_data', 'alice', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['title'], 'Mine')
@@ -0,0 +1,7 @@
+from rest_framework.routers import DefaultRouter
+from .views import BulkViewSet
+
+router = DefaultRouter()
+router.register('bulk', BulkViewSet, basename='bulk')
+
+urlpatterns = router.urls
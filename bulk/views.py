@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from .exporters import export_ndjson
+from .importers import import_records
+
+User = get_user_model()
+
+
+class BulkViewSet(viewsets.ViewSet):
+    """Admin-only NDJSON import of posts and messages, and streaming export of a user's data."""
+    permission_classes = [IsAdminUser]
+    lookup_field = 'username'
+    lookup_value_regex = '[^/]+'
+
+    @swagger_auto_schema(
+        operation_description="Body is NDJSON: one {\"type\": \"post\" | \"direct_message\" | \"group_message\", ...} "
+                              "object per line. Usernames identify users; created_at is optional.",
+        responses={200: openapi.Response("Imported counts per type and the first rejected lines")},
+    )
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_data(self, request):
+        # Read the body line by line instead of through a parser, so large uploads are never held in memory.
+        result = import_records(request.stream or ())
+        return Response(result, status=200)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, username=None):
+        user = get_object_or_404(User, username=username)
+        response = StreamingHttpResponse(export_ndjson(user), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{user.username}.ndjson"'
+        return response
@@ -0,0 +1,24 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import user_group_name
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes direct and group messages to the connected user; messages are still sent through the REST API."""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.user_group = user_group_name(user.id)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'user_group'):
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+
+    async def chat_message(self, event):
+        await self.send_json(event['payload'])
@@ -1,7 +1,7 @@
 import django_filters
 from django.contrib.auth import get_user_model
 from .models import GroupMessage
-from .models import Group, DirectMessage
+from .utils import resolve_group_member_ids
 
 User = get_user_model()
 
@@ -19,10 +19,10 @@ class GroupMessageFilter(django_filters.FilterSet):
             group = self.request.parser_context.get('kwargs', {}).get('group_pk')
         if group:
             try:
-                group_obj = Group.objects.get(pk=group)
-                member_qs = group_obj.members.all()
-                self.filters['sender'].queryset = member_qs
-                self.filters['sender'].field.queryset = member_qs
-            except Group.DoesNotExist:
-                pass
+                group = int(group)
+            except (TypeError, ValueError):
+                return
+            member_qs = User.objects.filter(id__in=resolve_group_member_ids(self.request, group))
+            self.filters['sender'].queryset = member_qs
+            self.filters['sender'].field.queryset = member_qs
 
@@ -0,0 +1,42 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return AnonymousUser()
+
+
+def get_raw_token(scope):
+    headers = dict(scope.get('headers', []))
+    auth_header = headers.get(b'authorization', b'').decode()
+    if auth_header.startswith('Bearer '):
+        return auth_header.split(' ', 1)[1]
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    tokens = query.get('token')
+    return tokens[0] if tokens else None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Authenticate WebSocket connections with a simplejwt access token.
+
+    Browsers cannot set headers on a WebSocket handshake, so the token may also be passed as ``?token=<access>``.
+    """
+
+    async def __call__(self, scope, receive, send):
+        raw_token = get_raw_token(scope)
+        scope = dict(scope)
+        scope['user'] = await get_user_for_token(raw_token) if raw_token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
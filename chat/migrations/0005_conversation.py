@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import Greatest, Least
+
+
+def backfill_conversations(apps, schema_editor):
+    DirectMessage = apps.get_model('chat', 'DirectMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+
+    # Existing history is treated as read; unread counting starts with this release.
+    pairs = (
+        DirectMessage.objects
+        .annotate(low=Least('sender_id', 'recipient_id'), high=Greatest('sender_id', 'recipient_id'))
+        .values('low', 'high')
+        .annotate(last_id=Max('id'))
+        .order_by()
+    )
+    pairs = list(pairs)
+    last_messages = DirectMessage.objects.in_bulk([pair['last_id'] for pair in pairs])
+    Conversation.objects.bulk_create([
+        Conversation(
+            user_low_id=pair['low'],
+            user_high_id=pair['high'],
+            last_message=last_messages[pair['last_id']],
+            last_activity_at=last_messages[pair['last_id']].created_at,
+            low_read_at=last_messages[pair['last_id']].created_at,
+            high_read_at=last_messages[pair['last_id']].created_at,
+        )
+        for pair in pairs
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_directmessage_dm_sender_recipient_created_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_activity_at', models.DateTimeField()),
+                ('low_unread_count', models.PositiveIntegerField(default=0)),
+                ('high_unread_count', models.PositiveIntegerField(default=0)),
+                ('low_read_at', models.DateTimeField(blank=True, null=True)),
+                ('high_read_at', models.DateTimeField(blank=True, null=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.directmessage')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_high', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_low', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_activity_at'], name='conv_low_activity'), models.Index(fields=['user_high', '-last_activity_at'], name='conv_high_activity')],
+                'unique_together': {('user_low', 'user_high')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from narma.model_utils.models import TimeStampedModel
-from django.db import models
-from django.contrib.auth import get_user_model
+from narma.utils.search import SEARCH_CONFIG
 
 User = get_user_model()
 
@@ -10,10 +11,52 @@ class DirectMessage(TimeStampedModel):
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     recipient = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     message = models.TextField()
+    search_vector = models.GeneratedField(
+        expression=SearchVector('message', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', 'recipient', 'created_at'], name='dm_sender_recipient_created'),
+            GinIndex(fields=['search_vector'], name='dm_search_vector'),
+        ]
 
     def __str__(self):
         return f"{self.sender} ➜ {self.recipient}: {self.message[:20]}"
 
+class Conversation(TimeStampedModel):
+    """Direct-message thread between two users, stored once per pair with ``user_low.id < user_high.id``."""
+    user_low = models.ForeignKey(User, related_name='conversations_low', on_delete=models.CASCADE)
+    user_high = models.ForeignKey(User, related_name='conversations_high', on_delete=models.CASCADE)
+    last_message = models.ForeignKey(DirectMessage, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_activity_at = models.DateTimeField()
+    low_unread_count = models.PositiveIntegerField(default=0)
+    high_unread_count = models.PositiveIntegerField(default=0)
+    low_read_at = models.DateTimeField(null=True, blank=True)
+    high_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user_low', 'user_high')
+        indexes = [
+            models.Index(fields=['user_low', '-last_activity_at', '-id'], name='conv_low_activity'),
+            models.Index(fields=['user_high', '-last_activity_at', '-id'], name='conv_high_activity'),
+        ]
+
+    def side(self, user):
+        return 'low' if user.id == self.user_low_id else 'high'
+
+    def other_user(self, user):
+        return self.user_high if user.id == self.user_low_id else self.user_low
+
+    def unread_count_for(self, user):
+        return getattr(self, f'{self.side(user)}_unread_count')
+
+    def __str__(self):
+        return f"{self.user_low} ↔ {self.user_high}"
+
+
 class Group(TimeStampedModel):
     name = models.CharField(max_length=255)
     owner = models.ForeignKey(User, related_name='owned_groups', on_delete=models.CASCADE)
@@ -26,6 +69,17 @@ class GroupMessage(TimeStampedModel):
     group = models.ForeignKey(Group, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
+    search_vector = models.GeneratedField(
+        expression=SearchVector('content', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'created_at'], name='groupmsg_group_created'),
+            GinIndex(fields=['search_vector'], name='groupmsg_search_vector'),
+        ]
 
     def __str__(self):
         return f"{self.sender} @ {self.group.name}: {self.content[:20]}"
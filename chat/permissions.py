@@ -1,9 +1,10 @@
 from rest_framework import permissions
-from .models import Group
+from .utils import resolve_group_member_ids
 
 class IsGroupMember(permissions.BasePermission):
     def has_permission(self, request, view):
-        group_id = view.kwargs.get("group_pk")
-        if not group_id:
+        try:
+            group_id = int(view.kwargs.get("group_pk"))
+        except (TypeError, ValueError):
             return False
-        return Group.objects.filter(pk=group_id, members=request.user).exists()
+        return request.user.id in resolve_group_member_ids(request, group_id)
@@ -0,0 +1,32 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from users.utils import blocked_among
+
+
+def user_group_name(user_id):
+    return f'user.{user_id}'
+
+
+def _push(user_ids, payload):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for user_id in user_ids:
+        async_to_sync(channel_layer.group_send)(
+            user_group_name(user_id),
+            {'type': 'chat.message', 'payload': payload},
+        )
+
+
+def push_direct_message(message, data):
+    _push([message.recipient_id], {'kind': 'direct', 'message': dict(data)})
+
+
+def push_group_message(message, data, member_ids):
+    blocked_ids = blocked_among(message.sender_id, member_ids)
+    recipient_ids = [
+        member_id for member_id in member_ids
+        if member_id != message.sender_id and member_id not in blocked_ids
+    ]
+    _push(recipient_ids, {'kind': 'group', 'group': message.group_id, 'message': dict(data)})
@@ -1,9 +1,9 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from users.utils import is_blocked
-from .models import DirectMessage, Group, GroupMessage
-from friends.models import Friend
+from users.utils import blocked_among
+from .models import Conversation, DirectMessage, Group, GroupMessage
+from friends.utils import get_friend_ids
 
 User = get_user_model()
 
@@ -15,6 +15,23 @@ class DirectMessageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'sender', 'recipient', 'created_at']
 
 
+class ConversationSerializer(serializers.ModelSerializer):
+    with_user = serializers.SerializerMethodField()
+    last_message = DirectMessageSerializer(read_only=True)
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'with_user', 'last_message', 'last_activity_at', 'unread_count']
+
+    def get_with_user(self, obj):
+        other = obj.other_user(self.context['request'].user)
+        return {'id': other.id, 'username': other.username}
+
+    def get_unread_count(self, obj):
+        return obj.unread_count_for(self.context['request'].user)
+
+
 class GroupSerializer(serializers.ModelSerializer):
     members = serializers.CharField(
         write_only=True,
@@ -42,14 +59,11 @@ class GroupSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Maximum of 10 users allowed in a group including you.")
 
         existing_users = User.objects.filter(username__in=usernames)
-        existing_usernames = set(existing_users.values_list('username', flat=True))
-
-        friend_usernames = set(
-            Friend.objects.filter(user=request_user).values_list('friend__username', flat=True)
-        )
+        friend_ids = get_friend_ids(request_user)
+        friend_usernames = {u.username for u in existing_users if u.id in friend_ids}
 
         invalid_usernames = [
-            u for u in usernames if u not in existing_usernames or u not in friend_usernames
+            u for u in usernames if u not in friend_usernames
         ]
 
         if invalid_usernames:
@@ -58,8 +72,7 @@ class GroupSerializer(serializers.ModelSerializer):
             )
 
         # ახალი: დაბლოკილი მომხმარებლების გამორჩევა
-        blocked_users = [u.username for u in existing_users if is_blocked(request_user, u)]
-        if blocked_users:
+        if blocked_among(request_user, [u.id for u in existing_users]):
             raise serializers.ValidationError(
                 f"Cannot add some users"
             )
@@ -70,7 +83,8 @@ class GroupSerializer(serializers.ModelSerializer):
         users = validated_data.pop('members', [])
         owner = self.context['request'].user
 
-        allowed_users = [u for u in users if not is_blocked(owner, u)]
+        blocked_ids = blocked_among(owner, [u.id for u in users])
+        allowed_users = [u for u in users if u.id not in blocked_ids]
 
         validated_data['owner'] = owner
         group = Group.objects.create(**validated_data)
@@ -179,14 +193,11 @@ class AddGroupMembersSerializer(serializers.Serializer):
             raise serializers.ValidationError("Maximum of 10 members allowed in a group.")
 
         existing_users = User.objects.filter(username__in=usernames)
-        existing_usernames = set(existing_users.values_list('username', flat=True))
-
-        friend_usernames = set(
-            Friend.objects.filter(user=self.current_user).values_list('friend__username', flat=True)
-        )
+        friend_ids = get_friend_ids(self.current_user)
+        friend_usernames = {u.username for u in existing_users if u.id in friend_ids}
 
         invalid_usernames = [
-            u for u in usernames if u not in existing_usernames or u not in friend_usernames
+            u for u in usernames if u not in friend_usernames
         ]
 
         if invalid_usernames:
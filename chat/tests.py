@@ -1,4 +1,13 @@
-from django.test import TestCase
+from inspect import iscoroutinefunction
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 
 from .serializers import (
@@ -10,13 +19,18 @@ from .serializers import (
     DeleteGroupSerializer,
 )
 from friends.models import Friend
-from .models import Group
+from .models import Conversation, DirectMessage, Group, GroupMessage
+from .realtime import user_group_name
+from .utils import GROUP_MEMBERS_CACHE_KEY, GROUP_MEMBERS_VERSION_KEY, get_group_member_ids, invalidate_group_members
+from narma.testing import AsyncViewsMixin, QueryBudgetMixin
+from narma.utils.pagination import LastActivityCursorPagination
 
 User = get_user_model()
 
 
 class GroupSerializerTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.owner = User.objects.create_user(username='owner', email='owner@gmail.com', password='pass')
         self.friend1 = User.objects.create_user(username='friend1', email='friend1@gmail.com', password='pass')
         self.friend2 = User.objects.create_user(username='friend2', email='friend2@gmail.com', password='pass')
@@ -58,6 +72,7 @@ class GroupSerializerTests(TestCase):
 
 class AddGroupMembersSerializerTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.owner = User.objects.create_user(username='owner', email='owner2@gmail.com', password='pass')
         self.friend1 = User.objects.create_user(username='friend1', email='friend1_2@gmail.com', password='pass')
         self.friend2 = User.objects.create_user(username='friend2', email='friend2_2@gmail.com', password='pass')
@@ -189,3 +204,292 @@ class OtherSerializersTests(TestCase):
         serializer = DeleteGroupSerializer(data={})
         self.assertFalse(serializer.is_valid())
         self.assertIn('confirm', serializer.errors)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class RealtimeDeliveryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = User.objects.create_user(username='sender', email='sender@gmail.com', password='pass')
+        self.recipient = User.objects.create_user(username='recipient', email='recipient@gmail.com', password='pass')
+        self.channel_layer = get_channel_layer()
+        self.channel_name = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(user_group_name(self.recipient.id), self.channel_name)
+        self.client.force_authenticate(self.sender)
+
+    def test_direct_message_is_pushed_to_recipient(self):
+        url = reverse('user-messages-list-create', kwargs={'username': 'recipient'})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'message': 'hello'})
+        self.assertEqual(response.status_code, 201)
+
+        event = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(event['payload']['kind'], 'direct')
+        self.assertEqual(event['payload']['message']['message'], 'hello')
+
+    def test_group_message_is_pushed_to_members(self):
+        group = Group.objects.create(name='Realtime', owner=self.sender)
+        group.members.set([self.sender, self.recipient])
+        url = reverse('group-messages-list', kwargs={'group_pk': group.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'content': 'hi all'})
+        self.assertEqual(response.status_code, 201)
+
+        event = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(event['payload']['kind'], 'group')
+        self.assertEqual(event['payload']['group'], group.pk)
+
+
+class ConversationInboxTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@gmail.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@gmail.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@gmail.com', password='pass')
+
+    def send(self, sender, recipient, text):
+        self.client.force_authenticate(sender)
+        url = reverse('user-messages-list-create', kwargs={'username': recipient.username})
+        response = self.client.post(url, {'message': text})
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def inbox(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('inbox'))
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_messages_update_one_conversation_per_pair(self):
+        self.send(self.alice, self.bob, 'hi')
+        self.send(self.bob, self.alice, 'hey')
+        self.send(self.alice, self.bob, 'how are you?')
+
+        self.assertEqual(Conversation.objects.count(), 1)
+        entry = self.inbox(self.bob)[0]
+        self.assertEqual(entry['with_user']['username'], 'alice')
+        self.assertEqual(entry['last_message']['message'], 'how are you?')
+        self.assertEqual(entry['unread_count'], 2)
+        self.assertEqual(self.inbox(self.alice)[0]['unread_count'], 1)
+
+    def test_inbox_is_ordered_by_activity(self):
+        self.send(self.alice, self.bob, 'first')
+        self.send(self.carol, self.alice, 'second')
+        self.assertEqual([c['with_user']['username'] for c in self.inbox(self.alice)], ['carol', 'bob'])
+
+        self.send(self.bob, self.alice, 'third')
+        self.assertEqual([c['with_user']['username'] for c in self.inbox(self.alice)], ['bob', 'carol'])
+
+    def test_inbox_query_count_is_constant(self):
+        for user in (self.bob, self.carol):
+            self.send(user, self.alice, 'hello')
+        self.client.force_authenticate(self.alice)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('inbox'))
+
+    def test_inbox_pages_through_both_sides_of_each_pair(self):
+        others = [
+            User.objects.create_user(username=f'pal{i}', email=f'pal{i}@gmail.com', password='pass') for i in range(5)
+        ]
+        for other in others:
+            self.send(other, self.carol, 'hi')
+        Conversation.objects.update(last_activity_at=Conversation.objects.first().last_activity_at)
+
+        self.client.force_authenticate(self.carol)
+        url, seen = reverse('inbox'), []
+        with mock.patch.object(LastActivityCursorPagination, 'page_size', 2):
+            while url:
+                response = self.client.get(url)
+                seen += [c['with_user']['username'] for c in response.data['results']]
+                url = response.data['next']
+        expected = Conversation.objects.order_by('-last_activity_at', '-id')
+        self.assertEqual(seen, [c.other_user(self.carol).username for c in expected])
+
+    def test_mark_read_resets_only_own_side(self):
+        self.send(self.alice, self.bob, 'one')
+        self.send(self.bob, self.alice, 'two')
+
+        self.client.force_authenticate(self.bob)
+        response = self.client.post(reverse('user-messages-read', kwargs={'username': 'alice'}))
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.inbox(self.bob)[0]['unread_count'], 0)
+        self.assertEqual(self.inbox(self.alice)[0]['unread_count'], 1)
+
+    def test_message_page_supports_conditional_get(self):
+        self.send(self.alice, self.bob, 'one')
+        self.client.force_authenticate(self.bob)
+        url = reverse('user-messages-list-create', kwargs={'username': 'alice'})
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Authorization', response['Vary'])
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.send(self.alice, self.bob, 'two')
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleting_unread_message_recomputes_conversation(self):
+        self.send(self.alice, self.bob, 'keep')
+        doomed = self.send(self.alice, self.bob, 'oops')
+
+        self.client.force_authenticate(self.alice)
+        url = reverse('user-messages-detail', kwargs={'username': 'bob', 'pk': doomed['id']})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+        entry = self.inbox(self.bob)[0]
+        self.assertEqual(entry['last_message']['message'], 'keep')
+        self.assertEqual(entry['unread_count'], 1)
+
+
+class GroupMembershipCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', email='owner5@gmail.com', password='pass')
+        self.member = User.objects.create_user(username='member', email='member5@gmail.com', password='pass')
+        self.group = Group.objects.create(name='Cached', owner=self.owner)
+        self.group.members.set([self.owner, self.member])
+        self.messages_url = reverse('group-messages-list', kwargs={'group_pk': self.group.pk})
+
+    def test_message_list_skips_membership_queries_on_cache_hit(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(self.messages_url).status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.messages_url)
+        self.assertEqual(response.status_code, 200)
+
+        filtered = self.client.get(self.messages_url, {'sender': self.owner.id})
+        self.assertEqual(filtered.status_code, 200)
+        self.assertEqual(self.client.get(self.messages_url, {'sender': 999999}).status_code, 400)
+
+    def test_message_page_etag_follows_sender_renames(self):
+        GroupMessage.objects.create(group=self.group, sender=self.owner, content='hi')
+        self.client.force_authenticate(self.member)
+        etag = self.client.get(self.messages_url)['ETag']
+        self.assertEqual(self.client.get(self.messages_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.owner.username = 'boss'
+        self.owner.save()
+        response = self.client.get(self.messages_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['sender_username'], 'boss')
+
+    def test_removed_member_loses_access(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(self.messages_url).status_code, 200)
+
+        self.client.force_authenticate(self.owner)
+        url = reverse('groups-remove-members', kwargs={'pk': self.group.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, {'members': 'member'}).status_code, 200)
+
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(self.messages_url).status_code, 403)
+
+    def test_deleted_group_is_forgotten(self):
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(self.messages_url).status_code, 200)
+        url = reverse('groups-delete-group', kwargs={'pk': self.group.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, {'confirm': True}).status_code, 200)
+        self.assertEqual(self.client.get(self.messages_url).status_code, 403)
+
+    def test_member_set_loaded_before_commit_is_not_reused(self):
+        pk = self.group.pk
+        members = {self.owner.pk, self.member.pk}
+        self.assertEqual(get_group_member_ids(pk), members)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.members.remove(self.member)
+            invalidate_group_members(pk)
+            # a concurrent reader that loaded the set before the removal committed writes it back
+            cache.set(GROUP_MEMBERS_CACHE_KEY.format(pk, cache.get(GROUP_MEMBERS_VERSION_KEY.format(pk))), members)
+        self.assertEqual(get_group_member_ids(pk), {self.owner.pk})
+
+
+class ChatQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='budget', email='budget@gmail.com', password='pass')
+        self.others = [
+            User.objects.create_user(username=f'peer{i}', email=f'peer{i}@gmail.com', password='pass')
+            for i in range(5)
+        ]
+        for i, other in enumerate(self.others):
+            group = Group.objects.create(name=f'Group {i}', owner=other)
+            group.members.set([self.user, *self.others])
+            GroupMessage.objects.create(group=group, sender=other, content='hello')
+            DirectMessage.objects.create(sender=other, recipient=self.user, message='hi')
+        self.group = group
+        self.client.force_authenticate(self.user)
+
+    def test_group_list_loads_owners_and_members_in_constant_queries(self):
+        with self.assertMaxQueries(3), self.assertNoNPlusOne():
+            response = self.client.get(reverse('groups-list'))
+        groups = response.data['results']
+        self.assertEqual(len(groups), 5)
+        self.assertEqual(len(groups[0]['member_details']), 6)
+        self.assertEqual(groups[0]['owner_username'], 'peer4')
+
+    def test_group_retrieve_stays_within_budget(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get(reverse('groups-detail', kwargs={'pk': self.group.pk}))
+        self.assertEqual(response.data['owner_username'], 'peer4')
+
+    def test_message_lists_have_no_per_row_queries(self):
+        for i in range(5):
+            GroupMessage.objects.create(group=self.group, sender=self.others[i], content=f'msg {i}')
+        with self.assertMaxQueries(2), self.assertNoNPlusOne():
+            response = self.client.get(reverse('group-messages-list', kwargs={'group_pk': self.group.pk}))
+        self.assertEqual(response.data['results'][0]['sender_username'], 'peer4')
+
+        with self.assertMaxQueries(2), self.assertNoNPlusOne():
+            self.client.get(reverse('user-messages-list-create', kwargs={'username': 'peer0'}))
+
+
+class AsyncChatViewTests(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@gmail.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@gmail.com', password='pass')
+        self.message = DirectMessage.objects.create(sender=self.bob, recipient=self.alice, message='hi')
+        self.group = Group.objects.create(name='Async', owner=self.alice)
+        self.group.members.set([self.alice, self.bob])
+        GroupMessage.objects.create(group=self.group, sender=self.bob, content='hello')
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.alice).access_token}'}
+
+    def test_read_routes_are_async_views_only_under_asgi(self):
+        for url in (
+            reverse('inbox'),
+            reverse('user-messages-list-create', kwargs={'username': 'bob'}),
+            reverse('user-messages-detail', kwargs={'username': 'bob', 'pk': self.message.pk}),
+            reverse('group-messages-list', kwargs={'group_pk': self.group.pk}),
+        ):
+            self.assertFalse(iscoroutinefunction(resolve(url).func), url)
+            self.assertTrue(iscoroutinefunction(self.async_view(url)[0]), url)
+        self.assertFalse(iscoroutinefunction(self.async_view(reverse('groups-list'))[0]))
+
+    async def test_async_reads_and_sync_writes_share_a_route(self):
+        url = reverse('user-messages-list-create', kwargs={'username': 'bob'})
+        response = await self.async_request('post', url, {'message': 'hey'}, headers=self.auth)
+        self.assertEqual(response.status_code, 201)
+
+        response = await self.async_request('get', url, headers=self.auth)
+        self.assertEqual([m['message'] for m in response.data['results']], ['hey', 'hi'])
+        response = await self.async_request('get', url, headers={**self.auth, 'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        detail = reverse('user-messages-detail', kwargs={'username': 'bob', 'pk': self.message.pk})
+        self.assertEqual((await self.async_request('get', detail, headers=self.auth)).data['message'], 'hi')
+        missing = reverse('user-messages-detail', kwargs={'username': 'bob', 'pk': self.message.pk + 1000})
+        self.assertEqual((await self.async_request('get', missing, headers=self.auth)).status_code, 404)
+
+        inbox = (await self.async_request('get', reverse('inbox'), headers=self.auth)).data['results']
+        self.assertEqual(inbox[0]['last_message']['message'], 'hey')
+
+    async def test_async_list_still_checks_permissions(self):
+        url = reverse('group-messages-list', kwargs={'group_pk': self.group.pk})
+        self.assertEqual((await self.async_request('get', url)).status_code, 401)
+        response = await self.async_request('get', url, headers=self.auth)
+        self.assertEqual(response.data['results'][0]['content'], 'hello')
@@ -1,7 +1,7 @@
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 from django.urls import path, include
-from .views import DirectMessageViewSet, GroupViewSet, GroupMessagesViewSet
+from .views import DirectMessageViewSet, InboxViewSet, GroupViewSet, GroupMessagesViewSet
 
 router = DefaultRouter()
 router.register('groups', GroupViewSet, basename='groups')
@@ -11,8 +11,12 @@ groups_router.register('messages', GroupMessagesViewSet, basename='group-message
 
 dm_list = DirectMessageViewSet.as_view({'get': 'list', 'post': 'create'})
 dm_detail = DirectMessageViewSet.as_view({'get': 'retrieve', 'delete': 'destroy'})
+dm_read = DirectMessageViewSet.as_view({'post': 'mark_read'})
+inbox = InboxViewSet.as_view({'get': 'list'})
 
 urlpatterns = [
+    path('inbox/', inbox, name='inbox'),
+    path('dm/<str:username>/read/', dm_read, name='user-messages-read'),
     path('dm/<str:username>/', dm_list, name='user-messages-list-create'),
     path('dm/<str:username>/<int:pk>/', dm_detail, name='user-messages-detail'),
 
@@ -0,0 +1,155 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from narma.db_routing import use_primary
+from narma.instrumentation import record_cache_access
+from narma.utils.pagination import make_keyset_cursor, parse_keyset_cursor
+from .models import Conversation, DirectMessage, Group
+
+GROUP_MEMBERS_CACHE_KEY = 'groups:members:{}:{}'
+GROUP_MEMBERS_VERSION_KEY = 'groups:members:{}:version'
+GROUP_MEMBERS_CACHE_TIMEOUT = 60 * 60
+
+
+def user_pair(user1, user2):
+    return (user1, user2) if user1.id < user2.id else (user2, user1)
+
+
+def get_conversation(user1, user2, for_update=False):
+    low, high = user_pair(user1, user2)
+    queryset = Conversation.objects.select_for_update() if for_update else Conversation.objects
+    return queryset.filter(user_low=low, user_high=high).first()
+
+
+def record_message(message):
+    """Bump the pair's conversation for a newly sent message; call inside the message's transaction."""
+    low, high = user_pair(message.sender, message.recipient)
+    conversation, created = Conversation.objects.select_for_update().get_or_create(
+        user_low=low, user_high=high,
+        defaults={'last_message': message, 'last_activity_at': message.created_at},
+    )
+    recipient_side = conversation.side(message.recipient)
+    unread_field = f'{recipient_side}_unread_count'
+    Conversation.objects.filter(pk=conversation.pk).update(
+        last_message=message,
+        last_activity_at=message.created_at,
+        updated_at=timezone.now(),
+        **{unread_field: F(unread_field) + 1},
+    )
+
+
+def read_inbox(user, before=None, limit=30):
+    """Return one page of ``user``'s conversations, most recently active first, and the cursor for the next one.
+
+    ``user`` is either side of a pair, so each side is read in the order of its own index and only the first
+    ``limit + 1`` rows of both are merged, rather than sorting every conversation the user ever had.
+    """
+    before_at, before_id = parse_keyset_cursor(before)
+    sides = []
+    for field in ('user_low', 'user_high'):
+        side = Conversation.objects.filter(**{field: user})
+        if before_at and before_id is not None:
+            side = side.filter(Q(last_activity_at__lt=before_at) | Q(last_activity_at=before_at, id__lt=before_id))
+        elif before_at:
+            side = side.filter(last_activity_at__lt=before_at)
+        sides.append(side.order_by('-last_activity_at', '-id').values('pk')[:limit + 1])
+
+    conversations = list(
+        Conversation.objects.filter(pk__in=sides[0].union(sides[1], all=True))
+        .select_related('user_low', 'user_high', 'last_message')
+        .defer('last_message__search_vector')
+        .order_by('-last_activity_at', '-id')[:limit + 1]
+    )
+    next_before = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_before = make_keyset_cursor(conversations[-1].last_activity_at, conversations[-1].pk)
+    return conversations, next_before
+
+
+def mark_read(user, other):
+    with transaction.atomic():
+        conversation = get_conversation(user, other, for_update=True)
+        if conversation is None:
+            return None
+        side = conversation.side(user)
+        setattr(conversation, f'{side}_unread_count', 0)
+        setattr(conversation, f'{side}_read_at', timezone.now())
+        conversation.save(update_fields=[f'{side}_unread_count', f'{side}_read_at', 'updated_at'])
+    return conversation
+
+
+def refresh_conversation(user1, user2):
+    """Recompute last message and unread counts from the remaining messages, e.g. after a delete."""
+    with transaction.atomic():
+        conversation = get_conversation(user1, user2, for_update=True)
+        if conversation is None:
+            return
+        messages = DirectMessage.objects.filter(
+            Q(sender=conversation.user_low, recipient=conversation.user_high) |
+            Q(sender=conversation.user_high, recipient=conversation.user_low)
+        )
+        last_message = messages.order_by('-created_at', '-id').first()
+        if last_message is None:
+            conversation.delete()
+            return
+
+        conversation.last_message = last_message
+        conversation.last_activity_at = last_message.created_at
+        for side, reader in (('low', conversation.user_low), ('high', conversation.user_high)):
+            unread = messages.filter(recipient=reader)
+            read_at = getattr(conversation, f'{side}_read_at')
+            if read_at:
+                unread = unread.filter(created_at__gt=read_at)
+            setattr(conversation, f'{side}_unread_count', unread.count())
+        conversation.save()
+
+
+def _group_members_version(group_id):
+    """Current version of a group's member set; a missing one starts at the clock so it never reuses an old number."""
+    return cache.get_or_set(GROUP_MEMBERS_VERSION_KEY.format(group_id), time.time_ns, timeout=None)
+
+
+def get_group_member_ids(group_id):
+    """Return the member ids of a group, empty if it does not exist, loading them from the DB on a cache miss.
+
+    Sets are cached per version of the group, so a set loaded before a membership change committed can
+    only be written under the old version and is never read again.
+    """
+    key = GROUP_MEMBERS_CACHE_KEY.format(group_id, _group_members_version(group_id))
+    member_ids = cache.get(key)
+    record_cache_access(member_ids is not None)
+    if member_ids is None:
+        with use_primary():
+            member_ids = set(
+                Group.members.through.objects.filter(group_id=group_id).values_list('user_id', flat=True)
+            )
+        cache.set(key, member_ids, GROUP_MEMBERS_CACHE_TIMEOUT)
+    return member_ids
+
+
+def invalidate_group_members(*group_ids):
+    """Move the cached member sets of ``group_ids`` to a new version once the current transaction commits."""
+    def bump():
+        for group_id in group_ids:
+            key = GROUP_MEMBERS_VERSION_KEY.format(group_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def resolve_group_member_ids(request, group_id):
+    """Member ids for ``group_id``, resolved once per request and shared by permissions, views and filters."""
+    resolved = getattr(request, '_group_member_ids', None)
+    if resolved is None:
+        resolved = request._group_member_ids = {}
+    if group_id not in resolved:
+        resolved[group_id] = get_group_member_ids(group_id)
+    return resolved[group_id]
@@ -1,33 +1,48 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Prefetch, Q
 from django.shortcuts import get_object_or_404
 from rest_framework import mixins, viewsets, permissions
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import GroupMessageFilter
 
-from .models import DirectMessage, Group
+from .models import Conversation, DirectMessage, Group, GroupMessage
 from .serializers import (
-    DirectMessageSerializer, GroupSerializer, GroupMessageSerializer,
+    ConversationSerializer, DirectMessageSerializer, GroupSerializer, GroupMessageSerializer,
     LeaveGroupSerializer, TransferOwnershipSerializer, RemoveMembersSerializer,
     DeleteGroupSerializer, AddGroupMembersSerializer,
 )
 from .permissions import IsGroupMember
+from .realtime import push_direct_message, push_group_message
+from .utils import (
+    mark_read, read_inbox, record_message, refresh_conversation, invalidate_group_members, resolve_group_member_ids,
+)
+from narma.db_routing import ReplicaReadMixin
+from narma.utils.async_views import AsyncActionsMixin
+from narma.utils.conditional import ConditionalGetMixin
+from narma.utils.pagination import CreatedAtCursorPagination, LastActivityCursorPagination
 
 User = get_user_model()
-from users.utils import is_blocked
+from users.utils import is_blocked, blocked_among
 
 
 
 class DirectMessageViewSet(
+    AsyncActionsMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
     mixins.ListModelMixin, mixins.CreateModelMixin,
     mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
     viewsets.GenericViewSet
 ):
     serializer_class = DirectMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     lookup_field = "pk"
 
     def get_other_user(self):
@@ -43,18 +58,66 @@ class DirectMessageViewSet(
         return DirectMessage.objects.filter(
             Q(sender=self.request.user, recipient=other) |
             Q(sender=other, recipient=self.request.user)
-        ).order_by("-created_at")
+        ).defer("search_vector").order_by("-created_at", "-id")
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional_list(request)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        message = await self.aget_object()
+        return Response(self.get_serializer(message).data)
 
     def perform_create(self, serializer):
         recipient = self.get_other_user()
         if is_blocked(self.request.user, recipient):
             raise PermissionDenied()
-        serializer.save(sender=self.request.user, recipient=recipient)
+        with transaction.atomic():
+            message = serializer.save(sender=self.request.user, recipient=recipient)
+            record_message(message)
+        transaction.on_commit(lambda: push_direct_message(message, serializer.data))
 
     def perform_destroy(self, instance):
         if instance.sender != self.request.user:
             raise PermissionDenied("You can only delete messages you sent")
-        instance.delete()
+        with transaction.atomic():
+            instance.delete()
+            refresh_conversation(instance.sender, instance.recipient)
+
+    def mark_read(self, request, username=None):
+        conversation = mark_read(request.user, self.get_other_user())
+        if conversation is None:
+            return Response({"detail": "No conversation with this user."}, status=404)
+        return Response({"unread_count": 0})
+
+
+class InboxViewSet(AsyncActionsMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LastActivityCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        return self.render_inbox(*self.read_inbox_page())
+
+    async def alist(self, request, *args, **kwargs):
+        return self.render_inbox(*await sync_to_async(self.read_inbox_page)())
+
+    def read_inbox_page(self):
+        return read_inbox(
+            self.request.user,
+            before=self.request.query_params.get('before'),
+            limit=self.paginator.page_size,
+        )
+
+    def render_inbox(self, conversations, next_before):
+        next_url = None
+        if next_before:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'before', next_before)
+        return Response({
+            'next': next_url, 'previous': None, 'results': self.get_serializer(conversations, many=True).data,
+        })
 
 
 class GroupViewSet(
@@ -72,11 +135,18 @@ class GroupViewSet(
         if members:
             usernames = [username.strip() for username in members.split(',') if username.strip()]
             users_to_add = User.objects.filter(username__in=usernames).exclude(id=self.request.user.id)
-            allowed_users = [u for u in users_to_add if not is_blocked(self.request.user, u)]
+            blocked_ids = blocked_among(self.request.user, [u.id for u in users_to_add])
+            allowed_users = [u for u in users_to_add if u.id not in blocked_ids]
             group.members.add(*allowed_users)
+        invalidate_group_members(group.pk)
+
+    def get_base_queryset(self):
+        return Group.objects.select_related('owner').prefetch_related(
+            Prefetch('members', queryset=User.objects.only('id', 'username'))
+        )
 
     def get_queryset(self):
-        return Group.objects.filter(members=self.request.user)
+        return self.get_base_queryset().filter(members=self.request.user).order_by('-created_at', '-id')
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -92,12 +162,11 @@ class GroupViewSet(
 
     def get_object(self):
         pk = self.kwargs.get('pk')
-        print(f"Received group pk: {pk} (type: {type(pk)})")
         try:
             pk = int(pk)
         except (ValueError, TypeError):
             raise NotFound("Invalid group id")
-        return get_object_or_404(Group, pk=pk)
+        return get_object_or_404(self.get_base_queryset(), pk=pk)
 
 
     def get_group(self):
@@ -121,6 +190,7 @@ class GroupViewSet(
         if request.user not in group.members.all():
             return Response({"detail": "You are not a member of this group."}, status=404)
         group.members.remove(request.user)
+        invalidate_group_members(group.pk)
         return Response({"detail": "You have left the group."})
 
     @action(detail=True, methods=['post'])
@@ -131,6 +201,7 @@ class GroupViewSet(
         serializer.is_valid(raise_exception=True)
         group.owner = get_object_or_404(User, username=serializer.validated_data['new_owner_username'])
         group.save()
+        invalidate_group_members(group.pk)
         return Response({"detail": f"Ownership transferred to {group.owner.username}."})
 
     @action(detail=True, methods=['post'])
@@ -140,6 +211,7 @@ class GroupViewSet(
         serializer = self.get_serializer(data=request.data, group=group, current_user=request.user)
         serializer.is_valid(raise_exception=True)
         group.members.remove(*serializer.validated_data['members'])
+        invalidate_group_members(group.pk)
         return Response({"removed": [u.username for u in serializer.validated_data['members']]})
 
     @action(detail=True, methods=['post'])
@@ -150,7 +222,9 @@ class GroupViewSet(
         serializer.is_valid(raise_exception=True)
         if not serializer.validated_data.get('confirm'):
             return Response({"detail": "Please confirm deletion."}, status=400)
+        group_id = group.pk
         group.delete()
+        invalidate_group_members(group_id)
         return Response({"detail": "Group successfully deleted."})
 
     @action(detail=True, methods=['post'])
@@ -160,37 +234,59 @@ class GroupViewSet(
         serializer = self.get_serializer(data=request.data, group=group, current_user=request.user)
         serializer.is_valid(raise_exception=True)
 
-        members_to_add = [
-            member for member in serializer.validated_data['members']
-            if not is_blocked(request.user, member)
-        ]
+        members = serializer.validated_data['members']
+        blocked_ids = blocked_among(request.user, [member.id for member in members])
+        members_to_add = [member for member in members if member.id not in blocked_ids]
 
         group.members.add(*members_to_add)
+        invalidate_group_members(group.pk)
         return Response({"detail": "Members added successfully."})
 
 
 class GroupMessagesViewSet(
+    AsyncActionsMixin, ReplicaReadMixin, ConditionalGetMixin,
     mixins.ListModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet
 ):
     serializer_class = GroupMessageSerializer
     permission_classes = [permissions.IsAuthenticated, IsGroupMember]
     filter_backends = [DjangoFilterBackend]
     filterset_class = GroupMessageFilter
+    pagination_class = CreatedAtCursorPagination
+    conditional_related = ('sender',)
 
-    def get_group(self):
-        group_pk = self.kwargs.get("group_pk")
+    def get_group_id(self):
         try:
-            group_pk = int(group_pk)
+            return int(self.kwargs.get("group_pk"))
         except (ValueError, TypeError):
             raise NotFound("Invalid group id")
-        return get_object_or_404(Group, pk=group_pk, members=self.request.user)
+
+    def get_member_ids(self):
+        # Already resolved by IsGroupMember for this request, normally from the cache.
+        member_ids = resolve_group_member_ids(self.request, self.get_group_id())
+        if self.request.user.id not in member_ids:
+            raise NotFound("No Group matches the given query.")
+        return member_ids
 
     def get_queryset(self):
-        return self.get_group().messages.all().order_by("-created_at")
+        if getattr(self, 'swagger_fake_view', False):
+            return GroupMessage.objects.none()
+        self.get_member_ids()
+        return (
+            GroupMessage.objects.filter(group_id=self.get_group_id())
+            .select_related('sender')
+            .defer("search_vector")
+            .order_by("-created_at", "-id")
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional_list(request)
 
     def perform_create(self, serializer):
-        group = self.get_group()
-        for member in group.members.all():
-            if is_blocked(self.request.user, member):
-                raise PermissionDenied()
-        serializer.save(group=group, sender=self.request.user)
+        member_ids = self.get_member_ids()
+        if blocked_among(self.request.user, member_ids):
+            raise PermissionDenied()
+        message = serializer.save(group_id=self.get_group_id(), sender=self.request.user)
+        transaction.on_commit(lambda: push_group_message(message, serializer.data, member_ids))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q
+
+
+def remove_blocked_friendships(apps, schema_editor):
+    # The friends list used to drop these lazily on read; blocking now does it
+    # up front, so clear whatever the old code left behind.
+    Friend = apps.get_model('friends', 'Friend')
+    Block = apps.get_model('users', 'Block')
+    blocked = Block.objects.filter(
+        Q(blocker=OuterRef('user'), blocked=OuterRef('friend')) |
+        Q(blocker=OuterRef('friend'), blocked=OuterRef('user'))
+    )
+    Friend.objects.filter(Exists(blocked)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friends', '0003_friendrequest_updated_at'),
+        ('users', '0007_alter_user_profile_picture_block'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friend',
+            index=models.Index(fields=['user', '-id'], name='friend_user_newest'),
+        ),
+        migrations.RunPython(remove_blocked_friendships, migrations.RunPython.noop),
+    ]
@@ -24,6 +24,9 @@ class Friend(models.Model):
 
     class Meta:
         unique_together = ('user', 'friend')
+        indexes = [
+            models.Index(fields=['user', '-id'], name='friend_user_newest'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} ↔ {self.friend.username}"
@@ -2,6 +2,9 @@ from rest_framework import serializers
 from .models import FriendRequest, Friend
 from users.models import User
 from users.utils import is_blocked
+from .utils import are_friends, invalidate_friendship
+from django.db import transaction
+from posts.tasks import connect_timelines
 
 
 class FriendRequestSerializer(serializers.ModelSerializer):
@@ -33,8 +36,7 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         if request_user == user:
             raise serializers.ValidationError("You cannot send a friend request to yourself.")
 
-        from users.utils import is_blocked
-        if is_blocked(request_user, user) or is_blocked(user, request_user):
+        if is_blocked(request_user, user):
             raise serializers.ValidationError("You cannot send a friend request to this user.")
 
         return user
@@ -44,10 +46,10 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         from_user = self.context['request'].user
         to_user = validated_data.pop('to_user_username')
 
-        if is_blocked(from_user, to_user) or is_blocked(to_user, from_user):
+        if is_blocked(from_user, to_user):
             raise serializers.ValidationError("You cannot send a request to this user.")
 
-        if Friend.objects.filter(user=from_user, friend=to_user).exists():
+        if are_friends(from_user, to_user):
             raise serializers.ValidationError("You are already friends with this user.")
 
         if FriendRequest.objects.filter(from_user=from_user, to_user=to_user).exists():
@@ -57,6 +59,8 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         if reverse_request:
             Friend.objects.get_or_create(user=from_user, friend=to_user)
             Friend.objects.get_or_create(user=to_user, friend=from_user)
+            invalidate_friendship(from_user, to_user)
+            transaction.on_commit(lambda: connect_timelines.delay(from_user.id, to_user.id))
             reverse_request.delete()
 
         return FriendRequest.objects.create(from_user=from_user, to_user=to_user)
@@ -74,3 +78,13 @@ class FriendSerializer(serializers.ModelSerializer):
     class Meta:
         model = Friend
         fields = ['id', 'friend']
+
+
+class FriendRequestIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100)
+
+
+class FriendSuggestionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    mutual_friends = serializers.IntegerField()
@@ -0,0 +1,65 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from narma.instrumentation import record_cache_access
+from users.models import User
+from users.utils import get_block_ids
+from .models import Friend, FriendRequest
+from .utils import get_friend_ids, _user_id
+
+SUGGESTIONS_CACHE_KEY = 'friends:suggestions:{}'
+# Outlives the daily refresh so a slow run never leaves users without suggestions.
+SUGGESTIONS_CACHE_TIMEOUT = 60 * 60 * 26
+SUGGESTIONS_LIMIT = 50
+
+
+def compute_suggestions(user, limit=SUGGESTIONS_LIMIT):
+    """Rank friends-of-friends of ``user`` by mutual friend count."""
+    user_id = _user_id(user)
+    friend_ids = get_friend_ids(user_id)
+    if not friend_ids:
+        return []
+
+    pending_ids = set()
+    for from_id, to_id in FriendRequest.objects.filter(
+        Q(from_user_id=user_id) | Q(to_user_id=user_id)
+    ).values_list('from_user_id', 'to_user_id'):
+        pending_ids.add(to_id if from_id == user_id else from_id)
+    excluded_ids = friend_ids | get_block_ids(user_id) | pending_ids | {user_id}
+
+    rows = list(
+        Friend.objects
+        .filter(user_id__in=friend_ids)
+        .exclude(friend_id__in=excluded_ids)
+        .values('friend_id')
+        .annotate(mutual_friends=Count('id'))
+        .order_by('-mutual_friends', 'friend_id')[:limit]
+    )
+    usernames = dict(
+        User.objects.filter(id__in=[row['friend_id'] for row in rows], is_active=True).values_list('id', 'username')
+    )
+    return [
+        {'id': row['friend_id'], 'username': usernames[row['friend_id']], 'mutual_friends': row['mutual_friends']}
+        for row in rows if row['friend_id'] in usernames
+    ]
+
+
+def store_suggestions(user):
+    user_id = _user_id(user)
+    suggestions = compute_suggestions(user_id)
+    cache.set(SUGGESTIONS_CACHE_KEY.format(user_id), suggestions, SUGGESTIONS_CACHE_TIMEOUT)
+    return suggestions
+
+
+def get_suggestions(user):
+    """Precomputed suggestions for ``user``, or ``None`` if they have not been computed yet.
+
+    Friendships and blocks made since the last refresh are filtered out from
+    their cached sets, so a read never touches the database.
+    """
+    suggestions = cache.get(SUGGESTIONS_CACHE_KEY.format(_user_id(user)))
+    record_cache_access(suggestions is not None)
+    if suggestions is None:
+        return None
+    hidden_ids = get_friend_ids(user) | get_block_ids(user)
+    return [suggestion for suggestion in suggestions if suggestion['id'] not in hidden_ids]
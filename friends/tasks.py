@@ -0,0 +1,28 @@
+from celery import shared_task
+
+from .models import Friend
+from .suggestions import store_suggestions
+
+SUGGESTIONS_BATCH_SIZE = 500
+
+
+@shared_task
+def refresh_friend_suggestions(user_ids):
+    for user_id in user_ids:
+        store_suggestions(user_id)
+
+
+@shared_task
+def schedule_friend_suggestions(batch_size=SUGGESTIONS_BATCH_SIZE):
+    """Periodic entry point: fan the refresh out over every user that has friends."""
+    user_ids = (
+        Friend.objects.order_by('user_id').values_list('user_id', flat=True).distinct().iterator(chunk_size=batch_size)
+    )
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            refresh_friend_suggestions.delay(batch)
+            batch = []
+    if batch:
+        refresh_friend_suggestions.delay(batch)
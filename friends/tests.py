@@ -1,13 +1,22 @@
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth import get_user_model
 from friends.models import FriendRequest, Friend
+from friends.utils import get_friend_ids, are_friends
+from friends.suggestions import compute_suggestions, get_suggestions
+from unittest import mock
+from friends.tasks import refresh_friend_suggestions, schedule_friend_suggestions
+from posts.tasks import connect_timelines, disconnect_timelines
+from users.models import Block
+from users.utils import get_block_ids
 
 User = get_user_model()
 
 class FriendViewSetTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user1 = User.objects.create_user(username='alice', email='alice@example.com', password='pass123')
         self.user2 = User.objects.create_user(username='bob', email='bob@example.com', password='pass123')
         self.user3 = User.objects.create_user(username='charlie', email='charlie@example.com', password='pass123')
@@ -72,3 +81,138 @@ class FriendViewSetTests(APITestCase):
         response = self.client.post(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Friend.objects.count(), 0)
+
+    def test_friend_ids_cache_follows_accept_and_unfriend(self):
+        self.assertEqual(get_friend_ids(self.user1), set())
+        self.assertEqual(get_friend_ids(self.user2), set())
+
+        fr = FriendRequest.objects.create(from_user=self.user1, to_user=self.user2)
+        self.client.force_authenticate(user=self.user2)
+        with mock.patch.object(connect_timelines, 'delay'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('friend_request-accept', kwargs={'pk': fr.id}))
+
+        self.assertEqual((get_friend_ids(self.user1), get_friend_ids(self.user2)), ({self.user2.id}, {self.user1.id}))
+        with self.assertNumQueries(0):
+            self.assertTrue(are_friends(self.user1, self.user2))
+            self.assertTrue(are_friends(self.user2, self.user1))
+
+        friendship = Friend.objects.get(user=self.user2, friend=self.user1)
+        with mock.patch.object(disconnect_timelines, 'delay'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('friend-unfriend', kwargs={'pk': friendship.id}))
+
+        self.assertEqual((get_friend_ids(self.user1), get_friend_ids(self.user2)), (set(), set()))
+        with self.assertNumQueries(0):
+            self.assertFalse(are_friends(self.user1, self.user2))
+            self.assertFalse(are_friends(self.user2, self.user1))
+
+    def test_bulk_accept_creates_friendships_in_one_go(self):
+        dave = User.objects.create_user(username='dave', email='dave@example.com', password='pass123')
+        requests = [
+            FriendRequest.objects.create(from_user=sender, to_user=self.user1)
+            for sender in (self.user2, self.user3, dave)
+        ]
+        Block.objects.create(blocker=self.user1, blocked=dave)
+        foreign = FriendRequest.objects.create(from_user=self.user2, to_user=self.user3)
+
+        url = reverse('friend_request-bulk-accept')
+        response = self.client.post(url, {'ids': [fr.id for fr in requests] + [foreign.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], [requests[0].id, requests[1].id])
+        self.assertEqual(response.data['skipped'], [requests[2].id, foreign.id])
+
+        self.assertEqual(get_friend_ids(self.user1), {self.user2.id, self.user3.id})
+        self.assertEqual(Friend.objects.count(), 4)
+        self.assertEqual(list(FriendRequest.objects.order_by('id')), [requests[2], foreign])
+
+    def test_accept_refuses_request_from_blocked_user(self):
+        fr = FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+        Block.objects.create(blocker=self.user2, blocked=self.user1)
+        response = self.client.post(reverse('friend_request-accept', kwargs={'pk': fr.id}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Friend.objects.exists())
+        self.assertTrue(FriendRequest.objects.filter(pk=fr.pk).exists())
+
+    def test_bulk_decline_only_touches_own_requests(self):
+        mine = FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+        foreign = FriendRequest.objects.create(from_user=self.user2, to_user=self.user3)
+        response = self.client.post(reverse('friend_request-bulk-decline'), {'ids': [mine.id, foreign.id]}, format='json')
+        self.assertEqual(response.data, {'declined': [mine.id], 'skipped': [foreign.id]})
+        self.assertEqual(list(FriendRequest.objects.all()), [foreign])
+
+    def test_blocking_removes_friendship_and_pending_requests(self):
+        Friend.objects.create(user=self.user1, friend=self.user2)
+        Friend.objects.create(user=self.user2, friend=self.user1)
+        FriendRequest.objects.create(from_user=self.user2, to_user=self.user1)
+        self.assertTrue(are_friends(self.user1, self.user2))
+
+        self.client.post(reverse('blocks-list'), data={'blocked_username': 'bob'})
+
+        self.assertEqual(Friend.objects.count(), 0)
+        self.assertEqual(FriendRequest.objects.count(), 0)
+        self.assertFalse(are_friends(self.user2, self.user1))
+
+    def test_friend_list_is_a_constant_query_read(self):
+        for i in range(5):
+            other = User.objects.create_user(username=f'pal{i}', email=f'pal{i}@example.com', password='pass123')
+            Friend.objects.create(user=self.user1, friend=other)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('friend-list'))
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['friend']['username'], 'pal4')
+
+
+class FriendSuggestionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {
+            name: User.objects.create_user(username=name, email=f'{name}@example.com', password='pass123')
+            for name in ('me', 'f1', 'f2', 'f3', 'two_mutual', 'one_mutual', 'blocked', 'requested')
+        }
+        for friend in ('f1', 'f2', 'f3'):
+            self.befriend('me', friend)
+        self.befriend('f1', 'two_mutual')
+        self.befriend('f2', 'two_mutual')
+        self.befriend('f3', 'one_mutual')
+        self.befriend('f1', 'blocked')
+        self.befriend('f1', 'requested')
+        self.befriend('f2', 'f3')
+        Block.objects.create(blocker=self.users['blocked'], blocked=self.users['me'])
+        FriendRequest.objects.create(from_user=self.users['me'], to_user=self.users['requested'])
+        self.client.force_authenticate(self.users['me'])
+
+    def befriend(self, a, b):
+        Friend.objects.create(user=self.users[a], friend=self.users[b])
+        Friend.objects.create(user=self.users[b], friend=self.users[a])
+
+    def test_suggestions_rank_friends_of_friends_by_mutual_count(self):
+        self.assertEqual(
+            [(s['username'], s['mutual_friends']) for s in compute_suggestions(self.users['me'])],
+            [('two_mutual', 2), ('one_mutual', 1)],
+        )
+
+    def test_endpoint_serves_precomputed_list_without_queries(self):
+        url = reverse('friend-suggestions')
+        with mock.patch.object(refresh_friend_suggestions, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(url).data, [])
+        delay.assert_called_once_with([self.users['me'].id])
+        refresh_friend_suggestions(*delay.call_args.args)
+
+        get_friend_ids(self.users['me']), get_block_ids(self.users['me'])
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual([s['username'] for s in response.data], ['two_mutual', 'one_mutual'])
+
+    def test_scheduler_refreshes_every_user_with_friends(self):
+        with mock.patch.object(refresh_friend_suggestions, 'delay') as delay:
+            schedule_friend_suggestions(batch_size=3)
+        batches = [call.args[0] for call in delay.call_args_list]
+        self.assertTrue(all(len(batch) <= 3 for batch in batches))
+        self.assertEqual(sorted(sum(batches, [])), sorted(set(Friend.objects.values_list('user_id', flat=True))))
+        for batch in batches:
+            refresh_friend_suggestions(batch)
+        self.assertEqual(
+            [s['username'] for s in get_suggestions(self.users['f3'])],
+            ['f1', 'two_mutual'],
+        )
+        self.assertEqual([s['username'] for s in get_suggestions(self.users['me'])], ['two_mutual', 'one_mutual'])
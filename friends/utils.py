@@ -0,0 +1,54 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from narma.db_routing import use_primary
+from narma.instrumentation import record_cache_access
+from .models import Friend, FriendRequest
+
+FRIEND_IDS_CACHE_KEY = 'friends:ids:{}'
+FRIEND_IDS_CACHE_TIMEOUT = 60 * 60
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def get_friend_ids(user):
+    """Return the set of friend ids for ``user``, loading it from the DB on a cache miss."""
+    user_id = _user_id(user)
+    key = FRIEND_IDS_CACHE_KEY.format(user_id)
+    friend_ids = cache.get(key)
+    record_cache_access(friend_ids is not None)
+    if friend_ids is None:
+        with use_primary():
+            friend_ids = set(Friend.objects.filter(user_id=user_id).values_list('friend_id', flat=True))
+        cache.set(key, friend_ids, FRIEND_IDS_CACHE_TIMEOUT)
+    return friend_ids
+
+
+def are_friends(user1, user2):
+    return _user_id(user2) in get_friend_ids(user1)
+
+
+def invalidate_friendship(user1, user2):
+    """Drop both users' cached friend ids now and again once the transaction commits.
+
+    The second delete discards a set that a concurrent reader loaded before the change was visible.
+    """
+    invalidate_friend_ids(user1, user2)
+    transaction.on_commit(lambda: invalidate_friend_ids(user1, user2))
+
+
+def sever_relationship(user1, user2):
+    """Delete the friendship and any pending requests between two users in both directions."""
+    user1_id, user2_id = _user_id(user1), _user_id(user2)
+    Friend.objects.filter(
+        Q(user_id=user1_id, friend_id=user2_id) | Q(user_id=user2_id, friend_id=user1_id)
+    ).delete()
+    FriendRequest.objects.filter(
+        Q(from_user_id=user1_id, to_user_id=user2_id) | Q(from_user_id=user2_id, to_user_id=user1_id)
+    ).delete()
+
+
+def invalidate_friend_ids(*users):
+    cache.delete_many([FRIEND_IDS_CACHE_KEY.format(_user_id(user)) for user in users])
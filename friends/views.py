@@ -3,10 +3,19 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db import transaction
 
 from .models import FriendRequest, Friend
-from .serializers import FriendRequestSerializer, FriendSerializer
-from users.utils import is_blocked
+from .serializers import (
+    FriendRequestSerializer, FriendSerializer, FriendRequestIdsSerializer, FriendSuggestionSerializer,
+)
+from users.utils import blocked_among
+from .utils import invalidate_friendship
+from .suggestions import get_suggestions
+from .tasks import refresh_friend_suggestions
+from posts.tasks import connect_timelines, disconnect_timelines
+from narma.db_routing import ReplicaReadMixin
+from narma.utils.pagination import NewestFirstCursorPagination
 
 
 class FriendRequestViewSet(
@@ -24,9 +33,36 @@ class FriendRequestViewSet(
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def get_serializer_class(self):
+        if self.action in ('bulk_accept', 'bulk_decline'):
+            return FriendRequestIdsSerializer
+        return FriendRequestSerializer
+
     def perform_create(self, serializer):
         serializer.save()
 
+    def _accept_requests(self, requests):
+        """Turn pending ``requests`` to the current user into friendships; run inside a transaction.
+
+        Requests whose sender has a block with the user are left untouched and not returned.
+        """
+        user = self.request.user
+        blocked_ids = blocked_among(user, [fr.from_user_id for fr in requests])
+        accepted = [fr for fr in requests if fr.from_user_id not in blocked_ids]
+        accepted_ids = [fr.from_user_id for fr in accepted]
+
+        Friend.objects.bulk_create(
+            [Friend(user_id=sender_id, friend=user) for sender_id in accepted_ids] +
+            [Friend(user=user, friend_id=sender_id) for sender_id in accepted_ids],
+            ignore_conflicts=True,
+        )
+        FriendRequest.objects.filter(id__in=[fr.id for fr in accepted]).delete()
+
+        for sender_id in accepted_ids:
+            invalidate_friendship(sender_id, user)
+            transaction.on_commit(lambda sender_id=sender_id: connect_timelines.delay(sender_id, user.id))
+        return [fr.id for fr in accepted]
+
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
         fr = self.get_object()
@@ -35,13 +71,40 @@ class FriendRequestViewSet(
         if fr.is_accepted:
             return Response({"detail": "Already accepted."}, status=400)
 
-        fr.is_accepted = True
-        fr.save()
-        Friend.objects.get_or_create(user=fr.from_user, friend=fr.to_user)
-        Friend.objects.get_or_create(user=fr.to_user, friend=fr.from_user)
-        fr.delete()
+        with transaction.atomic():
+            if not self._accept_requests([fr]):
+                raise PermissionDenied("Cannot accept a request from a blocked user.")
         return Response({'status': 'Friendship accepted ✅'}, status=200)
 
+    @action(detail=False, methods=['post'])
+    def bulk_accept(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+
+        with transaction.atomic():
+            requests = list(
+                FriendRequest.objects.select_for_update()
+                .filter(to_user=request.user, id__in=ids, is_accepted=False)
+            )
+            accepted = self._accept_requests(requests)
+        return Response({'accepted': sorted(accepted), 'skipped': sorted(ids - set(accepted))}, status=200)
+
+    @action(detail=False, methods=['post'])
+    def bulk_decline(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+
+        with transaction.atomic():
+            declined = set(
+                FriendRequest.objects.select_for_update()
+                .filter(to_user=request.user, id__in=ids, is_accepted=False)
+                .values_list('id', flat=True)
+            )
+            FriendRequest.objects.filter(id__in=declined).delete()
+        return Response({'declined': sorted(declined), 'skipped': sorted(ids - declined)}, status=200)
+
     @action(detail=True, methods=['post'])
     def decline(self, request, pk=None):
         fr = self.get_object()
@@ -55,21 +118,17 @@ class FriendRequestViewSet(
 
 
 class FriendViewSet(
+    ReplicaReadMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet
 ):
     serializer_class = FriendSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
-        user = self.request.user
-        qs = Friend.objects.filter(user=user)
-        for friendship in qs:
-            if is_blocked(user, friendship.friend) or is_blocked(friendship.friend, user):
-                Friend.objects.filter(user=user, friend=friendship.friend).delete()
-                Friend.objects.filter(user=friendship.friend, friend=user).delete()
-        return Friend.objects.filter(user=user)
+        return Friend.objects.filter(user=self.request.user).select_related('friend')
 
     def get_object(self):
         queryset = self.get_queryset()
@@ -81,9 +140,19 @@ class FriendViewSet(
         self.check_object_permissions(self.request, obj)
         return obj
 
+    @action(detail=False, methods=['get'], serializer_class=FriendSuggestionSerializer, pagination_class=None)
+    def suggestions(self, request):
+        suggestions = get_suggestions(request.user)
+        if suggestions is None:
+            transaction.on_commit(lambda: refresh_friend_suggestions.delay([request.user.id]))
+            suggestions = []
+        return Response(self.get_serializer(suggestions, many=True).data)
+
     @action(detail=True, methods=['post'])
     def unfriend(self, request, pk=None):
         friend = self.get_object()
         Friend.objects.filter(user=friend.user, friend=friend.friend).delete()
         Friend.objects.filter(user=friend.friend, friend=friend.user).delete()
+        invalidate_friendship(friend.user, friend.friend)
+        transaction.on_commit(lambda: disconnect_timelines.delay(friend.user_id, friend.friend_id))
         return Response({'status': 'Friend removed.'}, status=200)
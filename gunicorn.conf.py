@@ -0,0 +1,14 @@
+import os
+
+bind = '0.0.0.0:8000'
+if os.getenv('PROCESS_ROLE') == 'asgi':
+    # Uvicorn workers serve narma.asgi: one event loop per worker handles many requests at once,
+    # with async views awaiting I/O instead of holding the worker.
+    wsgi_app = 'narma.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'narma.wsgi:application'
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+# Each worker opens a DB pool of GUNICORN_THREADS + 1 connections, ASGI_THREADS + 1 for uvicorn workers
+# (see DB_POOL_MODE in settings), so workers * (threads + 1) must fit in Postgres max_connections together with Celery and ASGI.
+threads = int(os.getenv('GUNICORN_THREADS', 1))
@@ -0,0 +1,121 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_PIN_KEY = 'db:primary-pin:{}'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def choose_replica():
+    return random.choice(replica_aliases())
+
+
+def pin_to_primary(user):
+    cache.set(PRIMARY_PIN_KEY.format(user.pk), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and cache.get(PRIMARY_PIN_KEY.format(user.pk)) is not None
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block, e.g. when the result is cached and must not be stale."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Send reads to the replica picked for the current request, everything else to ``default``.
+
+    Nothing goes to a replica unless ``ReplicaReadMixin`` opted the request in, and reads inside a
+    transaction always stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """Serve ``replica_read_actions`` from a replica unless the user wrote within ``REPLICA_STICKY_SECONDS``."""
+
+    replica_read_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            replica_aliases()
+            and request.method in SAFE_METHODS
+            and self.action in self.replica_read_actions
+            and not is_pinned_to_primary(request.user)
+        ):
+            self._replica_token = _read_alias.set(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            # Restored by value: async views run ``initial`` in a worker thread, i.e. in a copy of this context.
+            _read_alias.set(None if token.old_value is Token.MISSING else token.old_value)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class PrimaryPinMiddleware:
+    """After a user's successful write, keep their reads on the primary so they never miss their own changes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.is_write(request):
+            self.pin_after_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_write(request):
+            # The lazy session user and the cache write are both blocking.
+            await sync_to_async(self.pin_after_write)(request, response)
+        return response
+
+    def is_write(self, request):
+        return bool(replica_aliases()) and request.method not in SAFE_METHODS
+
+    def pin_after_write(self, request, response):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and response.status_code < 400:
+            pin_to_primary(user)
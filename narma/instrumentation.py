@@ -0,0 +1,257 @@
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger('narma.requests')
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+
+def n_plus_one_threshold():
+    return getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+
+
+class RequestMetrics:
+    """Query, DB time and cache counters for one request, or any block wrapped in ``collect_metrics``.
+
+    Counts also go to the enclosing collector, so a test budget around a request sees what the request saw.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.query_count = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.sql_shapes = Counter()
+
+    def chain(self):
+        metrics = self
+        while metrics is not None:
+            yield metrics
+            metrics = metrics.parent
+
+    def record_query(self, sql, duration):
+        for metrics in self.chain():
+            metrics.db_time += duration
+            metrics.query_count += 1
+            metrics.sql_shapes[sql] += 1
+
+    def record_cache_access(self, hit):
+        for metrics in self.chain():
+            if hit:
+                metrics.cache_hits += 1
+            else:
+                metrics.cache_misses += 1
+
+    def suspected_n_plus_one(self, threshold=None):
+        threshold = threshold or n_plus_one_threshold()
+        return {sql: count for sql, count in self.sql_shapes.items() if count >= threshold}
+
+
+def record_query(execute, sql, params, many, context):
+    """DB ``execute_wrapper`` installed on every connection of the process.
+
+    It reports to the collector in the calling context, which ``sync_to_async`` carries over to the worker
+    thread (and its own connection) that runs an async view's queries.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+@contextmanager
+def collect_metrics():
+    # Connections of this thread that were opened before this module was imported.
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    metrics = RequestMetrics(parent=_current_metrics.get())
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+def record_cache_access(hit):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.record_cache_access(hit)
+
+
+class MetricsRegistry:
+    """Per-process totals for each DRF view/action, rendered in the Prometheus text format."""
+
+    METRICS = (
+        ('requests', 'narma_requests_total', 'Requests handled.'),
+        ('queries', 'narma_db_queries_total', 'SQL queries executed.'),
+        ('db_seconds', 'narma_db_time_seconds_total', 'Time spent in SQL queries.'),
+        ('cache_hits', 'narma_cache_hits_total', 'Cache lookups that hit.'),
+        ('cache_misses', 'narma_cache_misses_total', 'Cache lookups that missed.'),
+        ('latency_seconds', 'narma_request_latency_seconds_total', 'Total request latency.'),
+        ('n_plus_one', 'narma_n_plus_one_suspected_total', 'Requests with repeated identical SQL.'),
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self._views = defaultdict(lambda: dict.fromkeys((name for name, _, _ in self.METRICS), 0))
+
+    def record(self, view, metrics, latency):
+        with self._lock:
+            totals = self._views[view]
+            totals['requests'] += 1
+            totals['queries'] += metrics.query_count
+            totals['db_seconds'] += metrics.db_time
+            totals['cache_hits'] += metrics.cache_hits
+            totals['cache_misses'] += metrics.cache_misses
+            totals['latency_seconds'] += latency
+            totals['n_plus_one'] += 1 if metrics.suspected_n_plus_one() else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {view: dict(totals) for view, totals in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for key, metric, description in self.METRICS:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for view, totals in sorted(snapshot.items()):
+                lines.append(f'{metric}{{view="{view}"}} {totals[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+POOL_METRICS = (
+    ('requests_num', None, 'narma_db_pool_requests_total', 'counter', 'Connections requested from the pool.'),
+    ('requests_wait_ms', 1000, 'narma_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.'),
+    ('requests_errors', None, 'narma_db_pool_errors_total', 'counter', 'Pool requests that timed out or failed.'),
+    ('pool_size', None, 'narma_db_pool_size', 'gauge', 'Connections open in the pool.'),
+    ('pool_available', None, 'narma_db_pool_available', 'gauge', 'Idle connections in the pool.'),
+    ('requests_waiting', None, 'narma_db_pool_waiting', 'gauge', 'Requests currently waiting for a connection.'),
+)
+
+
+def render_pool_metrics():
+    """Stats of this process's psycopg connection pools; empty when no database alias uses one."""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    if not stats:
+        return ''
+    lines = []
+    for key, divisor, metric, kind, description in POOL_METRICS:
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for alias, values in sorted(stats.items()):
+            value = values.get(key, 0)
+            lines.append(f'{metric}{{database="{alias}"}} {value / divisor if divisor else value}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(view_func, request):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_metrics() as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_metrics() as metrics:
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, latency):
+        view = getattr(request, 'metrics_view', 'unresolved')
+        registry.record(view, metrics, latency)
+
+        suspected = metrics.suspected_n_plus_one()
+        logger.log(
+            logging.WARNING if suspected else logging.INFO,
+            json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': metrics.query_count,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'cache_hits': metrics.cache_hits,
+                'cache_misses': metrics.cache_misses,
+                'latency_ms': round(latency * 1000, 2),
+                'n_plus_one': [{'sql': sql, 'count': count} for sql, count in suspected.items()],
+            }),
+        )
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(metrics.query_count)
+            response['X-DB-Time-Ms'] = f'{metrics.db_time * 1000:.2f}'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_label(view_func, request)
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render_prometheus() + render_pool_metrics(), content_type='text/plain; version=0.0.4')
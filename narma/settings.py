@@ -2,6 +2,7 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 from decouple import config
+from celery.schedules import crontab
 
 load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'rest_framework_simplejwt',
@@ -28,6 +30,9 @@ INSTALLED_APPS = [
     'drf_yasg',
     'chat',
     'posts',
+    'search',
+    'bulk',
+    'benchmarks',
 ]
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -35,11 +40,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'narma.instrumentation.RequestMetricsMiddleware',
+    'narma.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'narma.db_routing.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,6 +70,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'narma.wsgi.application'
+ASGI_APPLICATION = 'narma.asgi.application'
 
 
 
@@ -82,6 +90,65 @@ DATABASES = {
     }
 }
 
+# How this process reuses Postgres connections:
+#   pool       - a psycopg 3 connection pool per process (default)
+#   pgbouncer  - persistent connections to a PgBouncer in transaction pooling mode
+#   persistent - plain persistent connections (CONN_MAX_AGE) with health checks
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'pool')
+# Threads that can use a connection at the same time in this process: gunicorn --threads for "web",
+# ASGI_THREADS for "asgi" (uvicorn workers or daphne, where every in-flight request queries from a thread
+# of its own, so the pool caps concurrent queries), one task per prefork child for "celery".
+PROCESS_ROLE = os.getenv('PROCESS_ROLE', 'web')
+PROCESS_THREADS = {
+    'web': int(os.getenv('GUNICORN_THREADS', 1)),
+    'asgi': int(os.getenv('ASGI_THREADS', 4)),
+    'celery': 1,
+}[PROCESS_ROLE]
+# Without a pool, ASGI processes would keep one persistent connection per request thread.
+PERSISTENT_CONN_MAX_AGE = 0 if PROCESS_ROLE == 'asgi' else 60
+# Serve the read endpoints from their async twins (see narma.utils.async_views); only worth it under ASGI.
+ASYNC_VIEWS = PROCESS_ROLE == 'asgi'
+
+if DB_POOL_MODE == 'pool':
+    # Health checks make the pool test each connection as it is handed out.
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            # One spare connection for work outside the request threads (e.g. cache fills on startup).
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', PROCESS_THREADS + 1)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_idle': 300,
+        },
+    }
+elif DB_POOL_MODE == 'pgbouncer':
+    DATABASES['default'].update({
+        'HOST': os.getenv('PGBOUNCER_HOST', 'pgbouncer'),
+        'PORT': os.getenv('PGBOUNCER_PORT', '6432'),
+        'CONN_MAX_AGE': PERSISTENT_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        # Transaction pooling hands each transaction to any server connection, so neither
+        # server-side cursors nor prepared statements survive between statements.
+        'DISABLE_SERVER_SIDE_CURSORS': True,
+        'OPTIONS': {'prepare_threshold': None},
+    })
+else:
+    DATABASES['default'].update({'CONN_MAX_AGE': PERSISTENT_CONN_MAX_AGE, 'CONN_HEALTH_CHECKS': True})
+
+# Streaming replicas of ``default`` as "host[:port],host[:port]"; hot list/detail reads are spread over them.
+for index, address in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or '5432',
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+# How long a user's reads stay on the primary after they write; keep it above the replication lag.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+DATABASE_ROUTERS = ['narma.db_routing.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -118,9 +185,10 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
+EMAIL_TIMEOUT = 10
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
@@ -135,6 +203,15 @@ CACHES = {
     }
 }
 
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [("redis", 6379)],
+        },
+    }
+}
+
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
     'SECURITY_DEFINITIONS': {
@@ -165,5 +242,46 @@ REST_FRAMEWORK = {
 }
 
 
+SIMPLE_JWT = {
+    'USER_AUTHENTICATION_RULE': 'users.utils.can_authenticate',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.AccountTokenRefreshSerializer',
+}
+
+N_PLUS_ONE_THRESHOLD = 5
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'narma.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+CELERY_TASK_ROUTES = {
+    'users.tasks.send_email_async': {'queue': 'mail'},
+}
+CELERY_BEAT_SCHEDULE = {
+    'refresh-friend-suggestions': {
+        'task': 'friends.tasks.schedule_friend_suggestions',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'resume-account-deletions': {
+        'task': 'users.tasks.resume_account_deletions',
+        'schedule': crontab(minute=30),
+    },
+    'purge-expired-data-exports': {
+        'task': 'users.tasks.purge_expired_data_exports',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory
+
+from .instrumentation import collect_metrics
+
+
+class QueryBudgetMixin:
+    """TestCase mixin for locking in per-endpoint query budgets."""
+
+    @contextmanager
+    def assertMaxQueries(self, max_queries):
+        with collect_metrics() as metrics:
+            yield metrics
+        self.assertLessEqual(
+            metrics.query_count, max_queries,
+            f"{metrics.query_count} queries executed, budget is {max_queries}:\n" + '\n'.join(metrics.sql_shapes),
+        )
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        with collect_metrics() as metrics:
+            yield metrics
+        suspected = metrics.suspected_n_plus_one(threshold)
+        self.assertFalse(
+            suspected,
+            "Repeated identical queries (suspected N+1):\n"
+            + '\n'.join(f"{count}x {sql}" for sql, count in suspected.items()),
+        )
+
+
+class AsyncViewsMixin:
+    """TestCase mixin for calling routes the way ASGI processes serve them.
+
+    URL patterns are built at import time with ``ASYNC_VIEWS`` off, so the view a path resolves to is rebuilt
+    with the setting on and called directly (no middleware) on the test's event loop.
+    """
+
+    def async_view(self, path):
+        match = resolve(path)
+        with self.settings(ASYNC_VIEWS=True):
+            view = match.func.cls.as_view(match.func.actions, **match.func.initkwargs)
+        return view, match.args, match.kwargs
+
+    async def async_request(self, method, path, data=None, headers=None):
+        view, args, kwargs = self.async_view(path)
+        request = getattr(APIRequestFactory(), method)(path, data, format='json', headers=headers)
+        response = await view(request, *args, **kwargs)
+        return response.render() if hasattr(response, 'render') else response
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
+from narma.instrumentation import metrics_view
 from rest_framework import permissions
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
@@ -23,10 +24,13 @@ schema_view=get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include('users.urls')),
     path('', include('friends.urls')),
     path('', include('chat.urls')),
     path('', include('posts.urls')),
+    path('', include('search.urls')),
+    path('', include('bulk.urls')),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema_swagger_ui'),
     path('redoc/',schema_view.with_ui('redoc',cache_timeout=0),name='schema_redoc_ui'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
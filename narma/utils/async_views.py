@@ -0,0 +1,79 @@
+from functools import update_wrapper
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from django.utils.decorators import classonlymethod
+
+
+class AsyncActionsMixin:
+    """Let a viewset serve some of its actions from ``async def`` twins when running under ASGI.
+
+    An action ``list`` with a coroutine ``alist`` next to it is served by ``alist`` in ASGI processes
+    (``settings.ASYNC_VIEWS``): the route becomes an async view, the coroutine runs on the event loop once
+    authentication, permissions and throttling (all sync, and usually backed by the database or Redis) have
+    been checked in a worker thread, and the route's other actions run through ``sync_to_async``. WSGI
+    processes get the plain sync view, so they never pay for an event loop per request.
+    """
+
+    serve_async = False
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        if not settings.ASYNC_VIEWS or not any(cls.get_async_action(action) for action in actions.values()):
+            return super().as_view(actions, **initkwargs)
+        view = super().as_view(actions, serve_async=True, **initkwargs)
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            method = request.method.lower()
+            action = actions.get(method) or (actions.get('get') if method == 'head' else None)
+            if action and cls.get_async_action(action):
+                return await view(request, *args, **kwargs)
+            return await sync_view(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    @classmethod
+    def get_async_action(cls, action):
+        """Name of the coroutine serving ``action`` under ASGI, if the viewset has one."""
+        name = f'a{action}'
+        return name if iscoroutinefunction(getattr(cls, name, None)) else None
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower()) if self.serve_async else None
+        async_action = action and self.get_async_action(action)
+        if async_action:
+            return self.async_dispatch(getattr(self, async_action), request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def async_dispatch(self, handler, request, *args, **kwargs):
+        """``APIView.dispatch`` for coroutine handlers."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """``get_object`` with the row fetched through the async ORM."""
+        queryset = await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await aget_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
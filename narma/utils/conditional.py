@@ -0,0 +1,69 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+class ConditionalGetMixin:
+    """Answer unchanged GETs with 304 Not Modified before anything is serialized.
+
+    Views pass cheap validators (ids and ``updated_at`` values) to
+    ``conditional_response``; the body is only rendered when the client's
+    If-None-Match / If-Modified-Since no longer match. List rows are validated
+    by their own ``updated_at`` and that of the ``conditional_related`` objects
+    the serializer shows fields of, which must be loaded with ``select_related``.
+    """
+
+    conditional_related = ()
+
+    def conditional_response(self, request, render, *validators, last_modified=None):
+        etag = make_etag(request.get_full_path(), request.user.pk, *validators)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def list_rows(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return page, list(queryset) if page is None else page
+
+    def conditional_list(self, request):
+        """``list`` with validators taken from the rows of the requested page, which is fetched anyway."""
+        return self.conditional_rows(request, *self.list_rows())
+
+    async def aconditional_list(self, request):
+        """``conditional_list`` for async actions; DRF's filters and paginators query synchronously, so the
+        page is fetched in a worker thread and only serialized on the event loop."""
+        page, rows = await sync_to_async(self.list_rows)()
+        return self.conditional_rows(request, page, rows)
+
+    def row_timestamps(self, row):
+        """``updated_at`` of ``row`` and of the related objects rendered along with it."""
+        return (row.updated_at, *(getattr(row, name).updated_at for name in self.conditional_related))
+
+    def conditional_rows(self, request, page, rows):
+        def render():
+            data = self.get_serializer(rows, many=True).data
+            return Response(data) if page is None else self.get_paginated_response(data)
+
+        timestamps = [self.row_timestamps(row) for row in rows]
+        return self.conditional_response(
+            request, render,
+            [(row.pk, *row_timestamps) for row, row_timestamps in zip(rows, timestamps)],
+            last_modified=max((max(row_timestamps) for row_timestamps in timestamps), default=None),
+        )
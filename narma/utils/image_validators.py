@@ -1,5 +1,5 @@
 from django.core.exceptions import ValidationError
-from PIL import Image
+from django.core.files.images import get_image_dimensions
 
 def validate_image_size(image):
     limit = 5
@@ -9,8 +9,9 @@ def validate_image_size(image):
 def validate_image_resolution(image):
     min_width, min_height = 400, 300
     max_width, max_height = 4000, 4000
-    img = Image.open(image)
-    width, height = img.size
+    width, height = get_image_dimensions(image)
+    if width is None or height is None:
+        raise ValidationError("Upload a valid image.")
 
     if width > max_width or height > max_height:
         raise ValidationError("Maximum allowed resolution is 4000x4000 pixels.")
@@ -0,0 +1,51 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+IMAGE_VARIANTS = {
+    'thumbnail': (200, 200),
+    'feed': (800, 800),
+    'full': (2048, 2048),
+}
+
+
+def _variant_format():
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def build_image_variants(field_file, old_variants=None):
+    """Write resized, EXIF-free copies of ``field_file`` to storage and return ``{variant: path}``."""
+    for path in (old_variants or {}).values():
+        default_storage.delete(path)
+
+    image_format, extension = _variant_format()
+    directory, filename = os.path.split(field_file.name)
+    stem = os.path.splitext(filename)[0]
+
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+
+    variants = {}
+    for name, size in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, format=image_format, quality=82)
+        path = os.path.join(directory, 'variants', f'{stem}_{name}.{extension}')
+        variants[name] = default_storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def variant_urls(variants, request=None):
+    urls = {}
+    for name, path in (variants or {}).items():
+        url = default_storage.url(path)
+        urls[name] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,38 @@
+from django.utils.dateparse import parse_datetime
+from rest_framework.pagination import CursorPagination
+
+
+def make_keyset_cursor(timestamp, pk):
+    """``<timestamp>,<id>`` cursor for views that page by hand with a ``before`` query parameter."""
+    return f'{timestamp.isoformat()},{pk}'
+
+
+def parse_keyset_cursor(cursor):
+    """Split a ``make_keyset_cursor`` value; ``id`` is None for cursors that only carry the timestamp."""
+    timestamp, _, pk = (cursor or '').partition(',')
+    try:
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk) if pk else None
+    except ValueError:
+        return None, None
+    return (timestamp, pk) if timestamp else (None, None)
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Newest-first keyset pagination; ``id`` breaks ties between equal timestamps."""
+    ordering = ('-created_at', '-id')
+
+
+class NewestFirstCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key for tables without timestamps."""
+    ordering = '-id'
+
+
+class LastActivityCursorPagination(CursorPagination):
+    """Most-recently-active first; used by the direct-message inbox."""
+    ordering = ('-last_activity_at', '-id')
+
+
+class RankCursorPagination(CursorPagination):
+    """Best match first for full-text search results annotated with ``rank``."""
+    ordering = ('-rank', '-id')
@@ -0,0 +1,113 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from narma.db_routing import use_primary
+from narma.instrumentation import record_cache_access
+
+RESPONSE_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_STALE_GRACE = 30
+RESPONSE_CACHE_LOCK_TIMEOUT = 10
+RESPONSE_CACHE_WAIT = 1.0
+RESPONSE_CACHE_POLL_INTERVAL = 0.05
+RESPONSE_CACHE_GENERATION_KEY = 'responses:generation:{}'
+RESPONSE_CACHE_KEY = 'responses:{}:{}'
+RESPONSE_CACHE_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_generations(namespaces):
+    """Current generation of each namespace; a missing one starts at the clock so it never reuses an old number."""
+    keys = [RESPONSE_CACHE_GENERATION_KEY.format(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generations[key] = cache.get_or_set(key, time.time_ns, timeout=None)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(*namespaces):
+    """Invalidate every cached response of ``namespaces`` once the current transaction commits."""
+    def bump():
+        for namespace in namespaces:
+            key = RESPONSE_CACHE_GENERATION_KEY.format(namespace)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + RESPONSE_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(RESPONSE_CACHE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _from_entry(request, entry):
+    response = Response(entry['data'], headers=entry['headers'])
+    return get_conditional_response(
+        request,
+        etag=entry['headers'].get('ETag'),
+        last_modified=parse_http_date_safe(entry['headers'].get('Last-Modified')),
+        response=response,
+    )
+
+
+def cached_response(request, namespaces, render):
+    """Serve ``render()`` from a cache entry versioned by the generations of ``namespaces``.
+
+    Entries stay fresh for ``RESPONSE_CACHE_TIMEOUT`` seconds and are kept for a
+    grace period after that. Only the request holding the rebuild lock renders;
+    the others serve the stale entry, or wait briefly for the new one when there
+    is nothing to serve yet.
+    """
+    key = RESPONSE_CACHE_KEY.format('.'.join(map(str, get_generations(namespaces))), request.build_absolute_uri())
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    record_cache_access(entry is not None)
+
+    if entry is not None and entry['fresh_until'] > time.time():
+        return _from_entry(request, entry)
+
+    locked = cache.add(lock_key, 1, RESPONSE_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        entry = entry or _wait_for(key)
+        if entry is not None:
+            return _from_entry(request, entry)
+
+    try:
+        # Entries outlive replication lag, so build them from the primary.
+        with use_primary():
+            response = render()
+        if response.status_code == 200:
+            cache.set(key, {
+                'data': response.data,
+                'headers': {name: response[name] for name in RESPONSE_CACHE_HEADERS if response.has_header(name)},
+                'fresh_until': time.time() + RESPONSE_CACHE_TIMEOUT,
+            }, RESPONSE_CACHE_TIMEOUT + RESPONSE_CACHE_STALE_GRACE)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return response
+
+
+class AnonymousResponseCacheMixin:
+    """Cache anonymous GET responses in Redis, invalidated by ``bump_generation`` on ``response_cache_namespaces``."""
+
+    response_cache_namespaces = ()
+
+    def anonymous_cached(self, request, render):
+        if request.user.is_authenticated:
+            return render()
+        response = cached_response(request, self.response_cache_namespaces, render)
+        patch_vary_headers(response, ['Authorization'])
+        return response
@@ -0,0 +1,16 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+# Posts and messages are written in several languages (Georgian among them), so
+# vectors are built without language-specific stemming or stop words.
+SEARCH_CONFIG = 'simple'
+
+
+def ranked_search(queryset, text, field='search_vector'):
+    """Filter ``queryset`` to rows matching the web-style query ``text`` and annotate ``rank``."""
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    # ts_rank returns float4, which does not survive the round trip through a
+    # pagination cursor; double precision does.
+    rank = Cast(SearchRank(F(field), query), FloatField())
+    return queryset.filter(**{field: query}).annotate(rank=rank)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.utils import recount_reactions
+
+
+class Command(BaseCommand):
+    help = "Rebuild Post.likes_count / Post.dislikes_count from PostReaction rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Only report drifted posts.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        last_pk = 0
+        checked = fixed = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            fixed += recount_reactions(
+                Post.objects.filter(pk__gt=last_pk, pk__lte=batch[-1]), dry_run=dry_run
+            )
+            checked += len(batch)
+            last_pk = batch[-1]
+
+        verb = "would be repaired" if dry_run else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} posts, {fixed} {verb}."))
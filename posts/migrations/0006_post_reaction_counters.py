@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_reaction_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostReaction = apps.get_model('posts', 'PostReaction')
+
+    def count_of(reaction):
+        counts = (
+            PostReaction.objects
+            .filter(post=OuterRef('pk'), reaction=reaction)
+            .order_by()
+            .values('post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counts), Value(0))
+
+    Post.objects.update(
+        likes_count=count_of('like'),
+        dislikes_count=count_of('dislike'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_favoritepost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reaction_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_post_visibility_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='media_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from narma.utils.search import SEARCH_CONFIG
 from narma.model_utils.models import TimeStampedModel
 
 User = get_user_model()
@@ -9,6 +12,7 @@ class Post(TimeStampedModel):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     media = models.FileField(upload_to='posts/', blank=True, null=True)
+    media_variants = models.JSONField(default=dict, blank=True)
 
     VISIBILITY_CHOICES = [
         ('public', 'Public'),
@@ -21,6 +25,25 @@ class Post(TimeStampedModel):
         default='public'
     )
 
+    likes_count = models.PositiveIntegerField(default=0)
+    dislikes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['visibility', 'created_at'], name='post_visibility_created'),
+            GinIndex(fields=['search_vector'], name='post_search_vector'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -42,9 +65,40 @@ class PostReaction(TimeStampedModel):
         return f'{self.user.username} {self.reaction}d "{self.post.title}"'
 
 class Comment(TimeStampedModel):
+    PATH_SEGMENT_WIDTH = 12
+    MAX_DEPTH = 10
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    # Top-level comment of the thread (null for top-level comments themselves) and
+    # the zero-padded chain of ancestor ids, so a whole subtree is one indexed,
+    # correctly ordered range read.
+    root = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='+')
+    path = models.CharField(max_length=255, blank=True)
+    search_vector = models.GeneratedField(
+        expression=SearchVector('text', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='comment_search_vector'),
+            models.Index(
+                fields=['post', 'created_at'], condition=models.Q(parent__isnull=True), name='comment_post_top_created',
+            ),
+            models.Index(fields=['root', 'path'], name='comment_root_path'),
+        ]
+
+    @property
+    def depth(self):
+        return self.path.count('.')
+
+    def build_path(self):
+        segment = str(self.pk).zfill(self.PATH_SEGMENT_WIDTH)
+        return f'{self.parent.path}.{segment}' if self.parent_id else segment
 
     def __str__(self):
         return f'{self.author.username}: {self.text[:30]}'
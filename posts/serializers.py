@@ -1,25 +1,28 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 from .models import Post, PostReaction, PostReaction, Comment, FavoritePost
 from narma.utils.image_validators import validate_image_size, validate_image_resolution
+from narma.utils.image_variants import variant_urls
+from .utils import add_comment
 
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    likes_count = serializers.SerializerMethodField()
-    dislikes_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(read_only=True)
+    dislikes_count = serializers.IntegerField(read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
+    media_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = [
             'id', 'title', 'author', 'description',
-            'media', 'visibility', 'created_at',
-            'likes_count', 'dislikes_count'
+            'media', 'media_variants', 'visibility', 'created_at',
+            'likes_count', 'dislikes_count', 'comments_count'
         ]
 
-    def get_likes_count(self, obj):
-        return obj.reactions.filter(reaction='like').count()
-
-    def get_dislikes_count(self, obj):
-        return obj.reactions.filter(reaction='dislike').count()
+    def get_media_variants(self, obj):
+        return variant_urls(obj.media_variants, self.context.get('request'))
 
     def validate_media(self, media):
         if media:
@@ -37,10 +40,45 @@ class PostReactionSerializer(serializers.ModelSerializer):
 
 class CommentSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
+    parent = serializers.PrimaryKeyRelatedField(
+        queryset=Comment.objects.all(), required=False, allow_null=True,
+        help_text="Id of the comment being replied to",
+    )
 
     class Meta:
         model = Comment
-        fields = ['text', 'author']
+        fields = ['id', 'text', 'author', 'parent', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate_parent(self, parent):
+        if parent is None:
+            return parent
+        if parent.post_id != self.context['post'].pk:
+            raise serializers.ValidationError("You can only reply to comments on the same post.")
+        if parent.depth + 1 >= Comment.MAX_DEPTH:
+            raise serializers.ValidationError("This thread is too deep to reply to.")
+        return parent
+
+    def create(self, validated_data):
+        return add_comment(**validated_data)
+
+
+class CommentThreadSerializer(CommentSerializer):
+    replies = serializers.SerializerMethodField()
+    more_replies = serializers.SerializerMethodField(help_text="URL of the thread's replies past the loaded ones")
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['replies', 'more_replies']
+
+    def get_replies(self, obj):
+        return CommentThreadSerializer(getattr(obj, 'thread_replies', []), many=True, context=self.context).data
+
+    def get_more_replies(self, obj):
+        after = getattr(obj, 'more_replies_after', None)
+        if after is None:
+            return None
+        url = reverse('post-comment-replies', args=[obj.post_id, obj.pk], request=self.context.get('request'))
+        return replace_query_param(url, 'after', after)
 
 
 class FavoritePostSerializer(serializers.ModelSerializer):
@@ -0,0 +1,54 @@
+from celery import shared_task
+from django.utils import timezone
+
+from friends.utils import get_friend_ids
+from narma.utils.image_variants import build_image_variants
+from narma.utils.response_cache import bump_generation
+from users.utils import blocked_among
+from . import timeline
+from .models import Post
+
+
+@shared_task
+def fan_out_post(post_id):
+    try:
+        post = Post.objects.get(pk=post_id)
+    except Post.DoesNotExist:
+        return
+    if post.visibility not in timeline.TIMELINE_VISIBILITIES:
+        return
+    friend_ids = get_friend_ids(post.author_id)
+    blocked_ids = blocked_among(post.author_id, friend_ids)
+    timeline.push_post(post, friend_ids - blocked_ids)
+
+
+@shared_task
+def remove_post_from_timelines(post_id, author_id):
+    timeline.remove_posts([post_id], get_friend_ids(author_id) | {author_id})
+
+
+@shared_task
+def connect_timelines(user1_id, user2_id):
+    timeline.add_author_posts(user1_id, user2_id)
+    timeline.add_author_posts(user2_id, user1_id)
+
+
+@shared_task
+def disconnect_timelines(user1_id, user2_id):
+    timeline.remove_author_posts(user1_id, user2_id)
+    timeline.remove_author_posts(user2_id, user1_id)
+
+
+@shared_task
+def process_post_media(post_id):
+    try:
+        post = Post.objects.get(pk=post_id)
+    except Post.DoesNotExist:
+        return
+    if not post.media:
+        return
+    variants = build_image_variants(post.media, old_variants=post.media_variants)
+    Post.objects.filter(pk=post_id, media=post.media.name).update(
+        media_variants=variants, updated_at=timezone.now()
+    )
+    bump_generation('posts')
@@ -1,15 +1,38 @@
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from io import BytesIO, StringIO
+from PIL import Image
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import Post, PostReaction, Comment, FavoritePost
+from django_redis import get_redis_connection
 from friends.models import Friend
+from narma import db_routing
+from narma.db_routing import PRIMARY_PIN_KEY, ReplicaRouter, use_primary
+from narma.instrumentation import RequestMetricsMiddleware, collect_metrics, registry, render_pool_metrics
+from narma.utils.response_cache import bump_generation
+from narma.testing import AsyncViewsMixin, QueryBudgetMixin
+from .tasks import fan_out_post, disconnect_timelines, process_post_media
+from .timeline import TIMELINE_KEY, read_timeline
+from .utils import THREAD_REPLIES_LIMIT, add_comment, visible_posts
 
 User = get_user_model()
 
 class PostViewSetTests(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='user1', email='user1@example.com', password='pass123')
         self.friend = User.objects.create_user(username='user2', email='user2@example.com', password='pass123')
         self.other_user = User.objects.create_user(username='user3', password='pass123')
@@ -81,7 +104,120 @@ class PostViewSetTests(APITestCase):
         url = reverse('post-comments', args=[self.public_post.pk])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_post_detail_supports_conditional_get(self):
+        url = reverse('post-detail', args=[self.public_post.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Authorization', response['Vary'])
+        etag = response['ETag']
+
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached['ETag'], etag)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+
+        self.client.post(reverse('post-react', args=[self.public_post.pk]), {'reaction': 'like'})
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.data['likes_count'], 1)
+
+        self.other_user.username = 'renamed_author'
+        self.other_user.save()
+        renamed = self.client.get(url, HTTP_IF_NONE_MATCH=changed['ETag'], HTTP_IF_MODIFIED_SINCE=changed['Last-Modified'])
+        self.assertEqual(renamed.status_code, status.HTTP_200_OK)
+        self.assertEqual(renamed.data['author'], 'renamed_author')
+
+    def test_anonymous_feed_is_served_from_cache_until_posts_change(self):
+        self.client.credentials()
+        url = reverse('post-list')
+        first = self.client.get(url)
+        self.assertEqual([post['id'] for post in first.data['results']], [self.public_post.id])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.data, first.data)
+        self.assertIn('Authorization', cached['Vary'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.other_user, title="New", description="x", visibility="public")
+            bump_generation('posts')
+        refreshed = self.client.get(url)
+        self.assertEqual([p['id'] for p in refreshed.data['results']], [post.id, self.public_post.id])
+
+    def test_anonymous_post_detail_cache_follows_reactions(self):
+        url = reverse('post-detail', args=[self.public_post.pk])
+        self.client.credentials()
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('post-react', args=[self.public_post.pk]), {'reaction': 'like'})
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).data['likes_count'], 1)
+
+    def test_expired_entry_is_served_stale_while_another_request_rebuilds(self):
+        self.client.credentials()
+        url = reverse('post-detail', args=[self.public_post.pk])
+        with mock.patch('narma.utils.response_cache.RESPONSE_CACHE_TIMEOUT', -1):
+            self.client.get(url)
+        Post.objects.filter(pk=self.public_post.pk).update(title="Renamed")
+
+        with mock.patch('narma.utils.response_cache.cache.add', return_value=False), self.assertNumQueries(0):
+            stale = self.client.get(url)
+        self.assertEqual(stale.data['title'], "Public Post")
+        self.assertEqual(self.client.get(url).data['title'], "Renamed")
+
+    def test_replies_are_threaded_and_counted(self):
+        url = reverse('post-comment', args=[self.public_post.pk])
+        top = self.client.post(url, {'text': 'Top'}).data['comment']
+        reply = self.client.post(url, {'text': 'Reply', 'parent': top['id']}).data['comment']
+        self.client.post(url, {'text': 'Nested', 'parent': reply['id']})
+        self.client.post(url, {'text': 'Second reply', 'parent': top['id']})
+
+        self.public_post.refresh_from_db()
+        self.assertEqual(self.public_post.comments_count, 4)
+
+        response = self.client.get(reverse('post-comments', args=[self.public_post.pk]))
+        [thread] = response.data['results']
+        self.assertEqual([r['text'] for r in thread['replies']], ['Reply', 'Second reply'])
+        self.assertEqual(thread['replies'][0]['replies'][0]['text'], 'Nested')
+
+    def test_long_threads_are_capped_with_a_more_replies_link(self):
+        top = add_comment(self.public_post, self.user, 'Top')
+        first = add_comment(self.public_post, self.user, 'Reply 0', parent=top)
+        for i in range(1, THREAD_REPLIES_LIMIT + 5):
+            add_comment(self.public_post, self.user, f'Reply {i}', parent=first if i % 2 else top)
+
+        [thread] = self.client.get(reverse('post-comments', args=[self.public_post.pk])).data['results']
+        loaded = thread['replies'] + [nested for reply in thread['replies'] for nested in reply['replies']]
+        self.assertEqual(len(loaded), THREAD_REPLIES_LIMIT)
+        self.assertIsNone(thread['replies'][0]['more_replies'])
+
+        response = self.client.get(thread['more_replies'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rest = [reply['text'] for reply in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len(rest), 5)
+        self.assertFalse({reply['text'] for reply in loaded} & set(rest))
+        self.assertEqual({reply['parent'] for reply in response.data['results']} - {top.pk, first.pk}, set())
+
+        nested = self.client.get(reverse('post-comment-replies', args=[self.public_post.pk, first.pk]))
+        self.assertEqual(nested.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reply_must_target_same_post(self):
+        other = Comment.objects.create(post=self.friends_post, author=self.user, text='Elsewhere')
+        url = reverse('post-comment', args=[self.public_post.pk])
+        response = self.client.post(url, {'text': 'Reply', 'parent': other.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_react_to_post(self):
         url = reverse('post-react', args=[self.public_post.pk])
@@ -118,3 +254,273 @@ class PostViewSetTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
+
+    def test_reaction_counters_follow_react(self):
+        url = reverse('post-react', args=[self.public_post.pk])
+        self.client.post(url, {'reaction': 'like'})
+        self.public_post.refresh_from_db()
+        self.assertEqual((self.public_post.likes_count, self.public_post.dislikes_count), (1, 0))
+
+        self.client.post(url, {'reaction': 'dislike'})
+        self.public_post.refresh_from_db()
+        self.assertEqual((self.public_post.likes_count, self.public_post.dislikes_count), (0, 1))
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.public_post.refresh_from_db()
+        self.assertEqual((self.public_post.likes_count, self.public_post.dislikes_count), (0, 0))
+        self.assertEqual(PostReaction.objects.count(), 0)
+
+    def test_list_posts_has_no_per_post_queries(self):
+        url = reverse('post-list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for i in range(5):
+            Post.objects.create(author=self.other_user, title=f"Extra {i}", visibility="public")
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(before), len(after))
+
+    def test_recount_reactions_command_repairs_drift(self):
+        PostReaction.objects.create(post=self.public_post, user=self.user, reaction='like')
+        PostReaction.objects.create(post=self.public_post, user=self.friend, reaction='dislike')
+        Post.objects.filter(pk=self.friends_post.pk).update(likes_count=7)
+
+        call_command('recount_reactions', batch_size=2, stdout=StringIO())
+
+        self.public_post.refresh_from_db()
+        self.friends_post.refresh_from_db()
+        self.assertEqual((self.public_post.likes_count, self.public_post.dislikes_count), (1, 1))
+        self.assertEqual(self.friends_post.likes_count, 0)
+
+    def test_list_posts_uses_cursor_pagination(self):
+        for i in range(35):
+            Post.objects.create(author=self.other_user, title=f"Bulk {i}", visibility="public")
+
+        response = self.client.get(reverse('post-list'))
+        self.assertNotIn('count', response.data)
+        first_page = [p['id'] for p in response.data['results']]
+        self.assertEqual(len(first_page), 30)
+
+        response = self.client.get(response.data['next'])
+        second_page = [p['id'] for p in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertEqual(len(first_page) + len(second_page), 37)
+
+    def test_timeline_cursor_does_not_skip_posts_sharing_a_timestamp(self):
+        created_at = timezone.now() + timedelta(minutes=1)
+        for i in range(4):
+            for author, visibility in ((self.friend, 'friends'), (self.other_user, 'public')):
+                post = Post.objects.create(author=author, title=f"Tied {i}", visibility=visibility)
+                Post.objects.filter(pk=post.pk).update(created_at=created_at)
+        get_redis_connection('default').delete(TIMELINE_KEY.format(self.user.id))
+
+        seen, before = [], None
+        while True:
+            posts, before = read_timeline(self.user, before=before, limit=3)
+            seen += [post.id for post in posts]
+            if before is None:
+                break
+        expected = list(
+            visible_posts(self.user).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_new_post_is_fanned_out_to_materialized_friend_timelines(self):
+        read_timeline(self.friend)
+        read_timeline(self.user)
+        with mock.patch.object(fan_out_post, 'delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('post-list'), {'title': 'Fan out', 'visibility': 'friends'})
+        post_id = response.data['id']
+        delay.assert_called_once_with(post_id)
+
+        fan_out_post(post_id)
+
+        redis = get_redis_connection('default')
+        self.assertIsNotNone(redis.zscore(TIMELINE_KEY.format(self.friend.id), post_id))
+        self.assertIsNotNone(redis.zscore(TIMELINE_KEY.format(self.user.id), post_id))
+        self.assertIsNone(redis.zscore(TIMELINE_KEY.format(self.other_user.id), post_id))
+
+    def test_unfriend_prunes_timeline(self):
+        posts, _ = read_timeline(self.user)
+        self.assertIn(self.friends_post, posts)
+
+        Friend.objects.filter(user__in=[self.user, self.friend]).delete()
+        cache.clear()
+        disconnect_timelines(self.user.id, self.friend.id)
+
+        posts, _ = read_timeline(self.user)
+        self.assertNotIn(self.friends_post, posts)
+        self.assertIn(self.public_post, posts)
+
+    def test_timeline_rechecks_visibility_when_pruning_was_missed(self):
+        read_timeline(self.user)
+        Friend.objects.filter(user__in=[self.user, self.friend]).delete()
+        cache.clear()
+
+        posts, _ = read_timeline(self.user)
+        self.assertNotIn(self.friends_post, posts)
+        self.assertIn(self.public_post, posts)
+
+    def test_rolled_back_post_is_not_pushed_to_timelines(self):
+        read_timeline(self.user)
+        with mock.patch.object(fan_out_post, 'delay'), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                post = self.client.post(reverse('post-list'), {'title': 'Rolled back'}).data['id']
+                transaction.set_rollback(True)
+        self.assertIsNone(get_redis_connection('default').zscore(TIMELINE_KEY.format(self.user.id), post))
+
+    def test_process_post_media_builds_variants(self):
+        image = Image.new('RGB', (1200, 900), color='blue')
+        exif = Image.Exif()
+        exif[0x010F] = 'CameraMaker'
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            post = Post.objects.create(author=self.user, title='With media', media=upload)
+            process_post_media(post.id)
+            post.refresh_from_db()
+
+            self.assertEqual(set(post.media_variants), {'thumbnail', 'feed', 'full'})
+            with default_storage.open(post.media_variants['thumbnail']) as f:
+                thumbnail = Image.open(f)
+                self.assertLessEqual(max(thumbnail.size), 200)
+                self.assertFalse(thumbnail.getexif())
+
+            response = self.client.get(reverse('post-detail', args=[post.pk]))
+            self.assertTrue(response.data['media_variants']['feed'].startswith('http'))
+
+
+class RequestMetricsTests(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.user = User.objects.create_user(username='metrics', email='metrics@example.com', password='pass123')
+        for i in range(6):
+            Post.objects.create(author=self.user, title=f"Post {i}", visibility='public')
+
+    def test_comment_page_loads_threads_in_constant_queries(self):
+        post = Post.objects.first()
+        for i in range(5):
+            top = add_comment(post, self.user, f'Top {i}')
+            add_comment(post, self.user, f'Reply {i}', parent=add_comment(post, self.user, 'Mid', parent=top))
+        with self.assertMaxQueries(3), self.assertNoNPlusOne():
+            response = self.client.get(reverse('post-comments', args=[post.pk]))
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_feed_list_stays_within_query_budget(self):
+        with self.assertMaxQueries(3), self.assertNoNPlusOne():
+            response = self.client.get(reverse('post-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_repeated_queries_are_flagged_as_n_plus_one(self):
+        with collect_metrics() as metrics:
+            for post in Post.objects.all():
+                post.author.username
+        self.assertEqual(list(metrics.suspected_n_plus_one().values()), [6])
+
+    def test_middleware_records_per_view_metrics(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(reverse('post-list'))
+        totals = registry.snapshot()['PostViewSet.list']
+        self.assertEqual(totals['requests'], 1)
+        self.assertGreater(totals['queries'], 0)
+        self.assertIn('narma_db_queries_total{view="PostViewSet.list"}', registry.render_prometheus())
+
+    def test_pool_metrics_report_wait_time_per_database(self):
+        pool = mock.Mock(**{'get_stats.return_value': {'requests_num': 4, 'requests_wait_ms': 1500, 'pool_size': 2}})
+        with mock.patch.object(type(connections['default']), 'pool', new_callable=mock.PropertyMock, return_value=pool):
+            output = render_pool_metrics()
+        self.assertIn('narma_db_pool_wait_seconds_total{database="default"} 1.5', output)
+        self.assertIn('narma_db_pool_requests_total{database="default"} 4', output)
+        self.assertIn('narma_db_pool_waiting{database="default"} 0', output)
+
+
+class ReplicaRoutingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass123')
+        self.post = Post.objects.create(author=self.user, title="Routed", visibility='public')
+        self.client.force_authenticate(self.user)
+
+    def test_router_only_reads_from_replica_when_opted_in(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        token = db_routing._read_alias.set('replica_1')
+        try:
+            self.assertEqual(router.db_for_write(Post), 'default')
+            with use_primary():
+                self.assertEqual(router.db_for_read(Post), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Post), 'default')
+        finally:
+            db_routing._read_alias.reset(token)
+        self.assertFalse(router.allow_migrate('replica_1', 'posts'))
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    def test_reads_stick_to_primary_after_a_write(self):
+        detail = reverse('post-detail', args=[self.post.pk])
+        with mock.patch('narma.db_routing.choose_replica', return_value='default') as choose:
+            self.assertEqual(self.client.get(reverse('post-list')).status_code, 200)
+            self.client.get(detail)
+            self.client.get(reverse('post-comments', args=[self.post.pk]))
+            self.assertEqual(choose.call_count, 2)
+
+            self.client.post(reverse('post-react', args=[self.post.pk]), {'reaction': 'like'})
+            self.assertEqual(self.client.get(detail).data['likes_count'], 1)
+            self.assertEqual(choose.call_count, 2)
+
+            cache.delete(PRIMARY_PIN_KEY.format(self.user.pk))
+            self.client.get(detail)
+            self.assertEqual(choose.call_count, 3)
+        self.assertIsNone(db_routing._read_alias.get())
+
+
+class AsyncPostViewTests(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='async', email='async@example.com', password='pass123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass123')
+        self.post = Post.objects.create(author=self.other, title="Public", visibility='public')
+        self.hidden = Post.objects.create(author=self.other, title="Hidden", visibility='friends')
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    async def test_feed_and_detail_through_asgi(self):
+        response = await self.async_request('get', reverse('post-list'), headers=self.auth)
+        self.assertEqual([post['title'] for post in response.data['results']], ['Public'])
+
+        detail = await self.async_request('get', reverse('post-detail', args=[self.post.pk]), headers=self.auth)
+        self.assertEqual(detail.data['title'], 'Public')
+        self.assertIn('ETag', detail)
+        for pk in (self.hidden.pk, 'abc'):
+            response = await self.async_request('get', reverse('post-detail', args=[pk]), headers=self.auth)
+            self.assertEqual(response.status_code, 404)
+
+        anonymous = await self.async_request('get', reverse('post-comments', args=[self.post.pk]))
+        self.assertEqual(anonymous.data['results'], [])
+
+    async def test_middleware_counts_queries_run_in_worker_threads(self):
+        registry.reset()
+        url = reverse('post-detail', args=[self.post.pk])
+        view, args, kwargs = self.async_view(url)
+
+        async def get_response(request):
+            request.metrics_view = 'async-detail'
+            return await view(request, *args, **kwargs)
+
+        middleware = RequestMetricsMiddleware(get_response)
+        response = await middleware(APIRequestFactory().get(url, headers=self.auth))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(registry.snapshot()['async-detail']['queries'], 0)
+
+    @override_settings(REPLICA_DATABASES=['default'])
+    async def test_async_reads_use_the_replica_and_release_it(self):
+        with mock.patch('narma.db_routing.choose_replica', return_value='default') as choose:
+            response = await self.async_request('get', reverse('post-detail', args=[self.post.pk]), headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(choose.call_count, 1)
+        self.assertIsNone(db_routing._read_alias.get())
@@ -0,0 +1,178 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+from django_redis import get_redis_connection
+
+from friends.utils import get_friend_ids
+from narma.db_routing import use_primary
+from narma.utils.pagination import make_keyset_cursor, parse_keyset_cursor
+from users.utils import get_block_ids
+from .models import Post
+from .utils import visible_posts
+
+TIMELINE_KEY = 'timeline:{}'
+TIMELINE_MAX_LENGTH = 1000
+TIMELINE_VISIBILITIES = ('public', 'friends')
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def _score(created_at):
+    return created_at.timestamp()
+
+
+def _trim(pipe, key):
+    pipe.zremrangebyrank(key, 0, -(TIMELINE_MAX_LENGTH + 1))
+
+
+def rebuild_timeline(user_id):
+    """Materialize the user's own posts and their friends' posts, newest first."""
+    friend_ids = get_friend_ids(user_id)
+    with use_primary():
+        rows = list(
+            Post.objects
+            .filter(Q(author_id=user_id) | Q(author_id__in=friend_ids, visibility__in=TIMELINE_VISIBILITIES))
+            .exclude(author_id__in=get_block_ids(user_id))
+            .order_by('-created_at', '-id')
+            .values_list('id', 'created_at')[:TIMELINE_MAX_LENGTH]
+        )
+    key = TIMELINE_KEY.format(user_id)
+    pipe = _redis().pipeline()
+    pipe.delete(key)
+    mapping = {str(post_id): _score(created_at) for post_id, created_at in rows}
+    if mapping:
+        pipe.zadd(key, mapping)
+    pipe.execute()
+
+
+def push_post(post, user_ids):
+    """Add ``post`` to the timelines of ``user_ids`` that are already materialized."""
+    user_ids = list(user_ids)
+    redis = _redis()
+    pipe = redis.pipeline()
+    for user_id in user_ids:
+        pipe.exists(TIMELINE_KEY.format(user_id))
+    existing = pipe.execute()
+
+    pipe = redis.pipeline()
+    for user_id, exists in zip(user_ids, existing):
+        if exists:
+            key = TIMELINE_KEY.format(user_id)
+            pipe.zadd(key, {str(post.id): _score(post.created_at)})
+            _trim(pipe, key)
+    pipe.execute()
+
+
+def remove_posts(post_ids, user_ids):
+    members = [str(post_id) for post_id in post_ids]
+    if not members:
+        return
+    pipe = _redis().pipeline()
+    for user_id in user_ids:
+        pipe.zrem(TIMELINE_KEY.format(user_id), *members)
+    pipe.execute()
+
+
+def drop_timelines(user_ids):
+    """Forget materialized timelines so the next read rebuilds them, e.g. after posts were bulk imported."""
+    keys = [TIMELINE_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        _redis().delete(*keys)
+
+
+def add_author_posts(user_id, author_id):
+    """Backfill ``author_id``'s recent posts into ``user_id``'s timeline after they become friends."""
+    key = TIMELINE_KEY.format(user_id)
+    redis = _redis()
+    if not redis.exists(key):
+        return
+    rows = (
+        Post.objects
+        .filter(author_id=author_id, visibility__in=TIMELINE_VISIBILITIES)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:TIMELINE_MAX_LENGTH]
+    )
+    mapping = {str(post_id): _score(created_at) for post_id, created_at in rows}
+    if mapping:
+        pipe = redis.pipeline()
+        pipe.zadd(key, mapping)
+        _trim(pipe, key)
+        pipe.execute()
+
+
+def remove_author_posts(user_id, author_id):
+    post_ids = (
+        Post.objects
+        .filter(author_id=author_id)
+        .order_by('-created_at')
+        .values_list('id', flat=True)[:TIMELINE_MAX_LENGTH]
+    )
+    remove_posts(post_ids, [user_id])
+
+
+def read_timeline(user, before=None, limit=30):
+    """Return one page of the home feed and the cursor for the next one.
+
+    Friends' and own posts come from the materialized timeline; public posts from everyone else stay pull-based and
+    are merged in by ``(created_at, id)``, which is also what the cursor holds so posts sharing a timestamp are not
+    skipped between pages.
+    """
+    key = TIMELINE_KEY.format(user.id)
+    redis = _redis()
+    if not redis.exists(key):
+        rebuild_timeline(user.id)
+
+    before_dt, before_id = parse_keyset_cursor(before)
+    if before_dt is None:
+        timeline_rows = redis.zrevrangebyscore(key, '+inf', '-inf', start=0, num=limit, withscores=True)
+    elif before_id is None:
+        timeline_rows = redis.zrevrangebyscore(key, f'({_score(before_dt)}', '-inf', start=0, num=limit, withscores=True)
+    else:
+        # Members sharing the cursor's score come back in string order, so fetch all of them and filter by id.
+        before_score = _score(before_dt)
+        tied = redis.zcount(key, before_score, before_score)
+        timeline_rows = redis.zrevrangebyscore(key, before_score, '-inf', start=0, num=limit + tied, withscores=True)
+    timeline_rows = [(int(member), score) for member, score in timeline_rows]
+    if before_id is not None:
+        timeline_rows = [row for row in timeline_rows if (row[1], row[0]) < (before_score, before_id)]
+        timeline_rows = sorted(timeline_rows, key=lambda row: (row[1], row[0]), reverse=True)[:limit]
+
+    blocked_ids = get_block_ids(user)
+    public_posts = Post.objects.filter(visibility='public').exclude(author_id__in=blocked_ids)
+    if before_dt and before_id is not None:
+        public_posts = public_posts.filter(Q(created_at__lt=before_dt) | Q(created_at=before_dt, id__lt=before_id))
+    elif before_dt:
+        public_posts = public_posts.filter(created_at__lt=before_dt)
+    public_rows = [
+        (post_id, _score(created_at))
+        for post_id, created_at in public_posts.order_by('-created_at', '-id').values_list('id', 'created_at')[:limit]
+    ]
+
+    merged = sorted(set(timeline_rows) | set(public_rows), key=lambda row: (row[1], row[0]), reverse=True)
+    page_ids = []
+    for post_id, _ in merged:
+        if post_id not in page_ids:
+            page_ids.append(post_id)
+        if len(page_ids) == limit:
+            break
+
+    # The timeline is only a candidate list: a post stays in it until a task prunes it, so visibility is checked
+    # again here (an unfriended author's friends-only posts must not outlive a lost ``disconnect_timelines``).
+    posts_by_id = visible_posts(user).select_related('author').defer('search_vector').in_bulk(page_ids)
+    posts = [posts_by_id[post_id] for post_id in page_ids if post_id in posts_by_id]
+
+    has_more = (
+        len(timeline_rows) == limit or len(public_rows) == limit or len({post_id for post_id, _ in merged}) > limit
+    )
+    next_before = None
+    if has_more and page_ids:
+        last_id = page_ids[-1]
+        if last_id in posts_by_id:
+            last_created_at = posts_by_id[last_id].created_at
+        else:
+            last_score = next(score for post_id, score in merged if post_id == last_id)
+            last_created_at = datetime.fromtimestamp(last_score, tz=dt_timezone.utc)
+        next_before = make_keyset_cursor(last_created_at, last_id)
+    return posts, next_before
@@ -0,0 +1,155 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.utils import timezone
+from friends.utils import get_friend_ids
+from narma.utils.response_cache import bump_generation
+from users.utils import get_block_ids
+from .models import Comment, Post, PostReaction
+
+REACTION_COUNTER_FIELDS = {
+    'like': 'likes_count',
+    'dislike': 'dislikes_count',
+}
+
+THREAD_REPLIES_LIMIT = 20
+
+
+def visible_posts(user, queryset=None):
+    """Posts ``user`` may read: public ones, their own, friends-only posts of friends, minus blocked authors."""
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    if not user.is_authenticated:
+        return queryset.filter(visibility='public')
+
+    return queryset.filter(
+        Q(visibility='public') |
+        Q(author=user) |
+        Q(visibility='friends', author_id__in=get_friend_ids(user))
+    ).exclude(author_id__in=get_block_ids(user))
+
+
+def update_reaction_counters(post_id, added=None, removed=None):
+    changes = {}
+    if added:
+        field = REACTION_COUNTER_FIELDS[added]
+        changes[field] = F(field) + 1
+    if removed:
+        field = REACTION_COUNTER_FIELDS[removed]
+        changes[field] = Greatest(F(field) - 1, Value(0))
+    if changes:
+        Post.objects.filter(pk=post_id).update(**changes, updated_at=timezone.now())
+        bump_generation('posts')
+
+
+def reaction_count_subquery(reaction):
+    counts = (
+        PostReaction.objects
+        .filter(post=OuterRef('pk'), reaction=reaction)
+        .order_by()
+        .values('post')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def comment_count_subquery():
+    counts = (
+        Comment.objects
+        .filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def recount_reactions(queryset=None, dry_run=False):
+    """Repair drifted reaction counters, returns the number of posts fixed."""
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    drifted = queryset.annotate(
+        actual_likes=reaction_count_subquery('like'),
+        actual_dislikes=reaction_count_subquery('dislike'),
+    ).exclude(
+        likes_count=F('actual_likes'),
+        dislikes_count=F('actual_dislikes'),
+    )
+    post_ids = list(drifted.values_list('pk', flat=True))
+
+    if post_ids and not dry_run:
+        Post.objects.filter(pk__in=post_ids).update(
+            updated_at=timezone.now(),
+            **{
+                field: reaction_count_subquery(reaction)
+                for reaction, field in REACTION_COUNTER_FIELDS.items()
+            }
+        )
+        bump_generation('posts')
+    return len(post_ids)
+
+
+def add_comment(post, author, text, parent=None):
+    """Create a comment or reply, fill in its thread path and bump ``post.comments_count``."""
+    with transaction.atomic():
+        comment = Comment.objects.create(
+            post=post, author=author, text=text, parent=parent,
+            root_id=(parent.root_id or parent.pk) if parent else None,
+        )
+        comment.path = comment.build_path()
+        Comment.objects.filter(pk=comment.pk).update(path=comment.path)
+        Post.objects.filter(pk=post.pk).update(comments_count=F('comments_count') + 1, updated_at=timezone.now())
+        bump_generation('posts')
+    return comment
+
+
+def attach_replies(comments, limit=THREAD_REPLIES_LIMIT):
+    """Load the first ``limit`` replies under each of the top-level ``comments`` in one query.
+
+    Every node gets ``thread_replies``; a thread with more replies also gets ``more_replies_after``, the id
+    of its last loaded reply, to continue from with ``thread_replies_page``.
+    """
+    nodes = {}
+    for comment in comments:
+        comment.thread_replies = []
+        comment.more_replies_after = None
+        nodes[comment.pk] = comment
+    if not nodes:
+        return comments
+
+    # Path order puts every reply after its parent and keeps siblings oldest first, so the first replies
+    # of a thread always hang off nodes that were loaded too.
+    replies = (
+        Comment.objects.filter(root_id__in=list(nodes)).select_related('author').defer('search_vector')
+        .annotate(thread_position=Window(RowNumber(), partition_by=F('root_id'), order_by=F('path').asc()))
+        .filter(thread_position__lte=limit + 1)
+        .order_by('path')
+    )
+    last_loaded = {}
+    for reply in replies:
+        if reply.thread_position > limit:
+            nodes[reply.root_id].more_replies_after = last_loaded[reply.root_id]
+            continue
+        reply.thread_replies = []
+        nodes[reply.pk] = reply
+        last_loaded[reply.root_id] = reply.pk
+        parent = nodes.get(reply.parent_id)
+        if parent is not None:
+            parent.thread_replies.append(reply)
+    return comments
+
+
+def thread_replies_page(comment, after=None, limit=THREAD_REPLIES_LIMIT):
+    """Replies under top-level ``comment`` in path order, following reply ``after``; returns ``(replies, next_after)``."""
+    replies = Comment.objects.filter(root_id=comment.pk).select_related('author').defer('search_vector')
+    if after is not None:
+        replies = replies.filter(path__gt=Subquery(Comment.objects.filter(pk=after, root_id=comment.pk).values('path')))
+    replies = list(replies.order_by('path')[:limit + 1])
+    if len(replies) > limit:
+        replies = replies[:limit]
+        return replies, replies[-1].pk
+    return replies, None
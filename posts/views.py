@@ -1,24 +1,34 @@
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q
+from rest_framework.utils.urls import replace_query_param
+from django.db import transaction
 from django.contrib.auth import get_user_model
 from drf_yasg.utils import swagger_auto_schema
 from .models import Post, PostReaction, FavoritePost
-from .serializers import PostSerializer, PostReactionSerializer, CommentSerializer, MinimalPostActionSerializer
-from friends.models import Friend
-from users.models import Block
+from .serializers import (
+    PostSerializer, PostReactionSerializer, CommentSerializer, CommentThreadSerializer, MinimalPostActionSerializer,
+)
+from .utils import attach_replies, thread_replies_page, update_reaction_counters, visible_posts
+from .timeline import push_post, read_timeline
+from .tasks import fan_out_post, remove_post_from_timelines, process_post_media
+from functools import partial
+from narma.db_routing import ReplicaReadMixin
+from narma.utils.async_views import AsyncActionsMixin
+from narma.utils.conditional import ConditionalGetMixin
+from narma.utils.response_cache import AnonymousResponseCacheMixin, bump_generation
+from narma.utils.pagination import CreatedAtCursorPagination
 User = get_user_model()
 
-def get_mutual_friends(user):
-    friends1 = Friend.objects.filter(user=user).values_list('friend_id', flat=True)
-    friends2 = Friend.objects.filter(friend=user).values_list('user_id', flat=True)
-    mutual_ids = set(friends1).intersection(friends2)
-    return User.objects.filter(id__in=mutual_ids)
-
-
 class PostViewSet(
+    AsyncActionsMixin,
+    ReplicaReadMixin,
+    AnonymousResponseCacheMixin,
+    ConditionalGetMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -27,47 +37,83 @@ class PostViewSet(
 ):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = CreatedAtCursorPagination
+    response_cache_namespaces = ('posts',)
+    conditional_related = ('author',)
     
     def get_serializer_class(self):
         if self.action == 'react':
             return PostReactionSerializer
-        elif self.action in ['comment', 'comments']:
+        elif self.action in ['comment', 'comment_replies']:
             return CommentSerializer
+        elif self.action == 'comments':
+            return CommentThreadSerializer
         elif self.action in ['favorite', 'unfavorite']:
             return MinimalPostActionSerializer
         return PostSerializer
 
 
     def get_queryset(self):
-        user = self.request.user
-
-        queryset = Post.objects.filter(visibility='public')
+        return (
+            visible_posts(self.request.user).select_related('author').defer('search_vector')
+            .order_by('-created_at', '-id')
+        )
 
-        if user.is_authenticated:
-            mutual_friends = get_mutual_friends(user)
-            queryset = Post.objects.filter(
-                Q(visibility='public') |
-                Q(author=user) |
-                Q(visibility='friends', author__in=mutual_friends)
-            )
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return self.anonymous_cached(request, partial(super().list, request, *args, **kwargs))
+        return self.render_timeline(*self.read_timeline_page())
+
+    async def alist(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            render = partial(super().list, request, *args, **kwargs)
+            return await sync_to_async(self.anonymous_cached)(request, render)
+        return self.render_timeline(*await sync_to_async(self.read_timeline_page)())
+
+    def read_timeline_page(self):
+        return read_timeline(
+            self.request.user,
+            before=self.request.query_params.get('before'),
+            limit=self.paginator.page_size,
+        )
 
-            blocked_ids = Block.objects.filter(
-                Q(blocker=user) | Q(blocked=user)
-            ).values_list('blocker_id', 'blocked_id')
+    def render_timeline(self, posts, next_before):
+        serializer = self.get_serializer(posts, many=True)
+        next_url = None
+        if next_before:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'before', next_before)
+        return Response({'next': next_url, 'previous': None, 'results': serializer.data})
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return self.anonymous_cached(request, self.render_detail)
+        return self.render_detail()
+
+    async def aretrieve(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return await sync_to_async(self.anonymous_cached)(request, self.render_detail)
+        return self.render_detail(await self.aget_object())
+
+    def render_detail(self, post=None):
+        post = post or self.get_object()
+        timestamps = self.row_timestamps(post)
+        return self.conditional_response(
+            self.request, lambda: Response(self.get_serializer(post).data),
+            post.pk, *timestamps, last_modified=max(timestamps),
+        )
 
-            blocked_user_ids = set()
-            for blocker_id, blocked_id in blocked_ids:
-                if blocker_id != user.id:
-                    blocked_user_ids.add(blocker_id)
-                if blocked_id != user.id:
-                    blocked_user_ids.add(blocked_id)
+    def perform_create(self, serializer):
+        post = serializer.save(author=self.request.user)
+        author_id = self.request.user.id
 
-            queryset = queryset.exclude(author__id__in=blocked_user_ids)
-        
-        return queryset.order_by('-created_at')
+        def publish():
+            push_post(post, [author_id])
+            fan_out_post.delay(post.id)
 
-    def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        transaction.on_commit(publish)
+        if post.media:
+            transaction.on_commit(lambda: process_post_media.delay(post.id))
+        bump_generation('posts')
 
     def destroy(self, request, *args, **kwargs):
         post = self.get_object()
@@ -76,21 +122,43 @@ class PostViewSet(
                 {'error': 'You do not have permission to delete this post.'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        return super().destroy(request, *args, **kwargs)
+        post_id, author_id = post.id, post.author_id
+        response = super().destroy(request, *args, **kwargs)
+        transaction.on_commit(lambda: remove_post_from_timelines.delay(post_id, author_id))
+        bump_generation('posts')
+        return response
 
-    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    @action(detail=True, methods=['post', 'delete'], permission_classes=[permissions.IsAuthenticated])
     def react(self, request, pk=None):
         post = self.get_object()
+
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                reaction = PostReaction.objects.select_for_update().filter(user=request.user, post=post).first()
+                if reaction is None:
+                    return Response({'error': 'You have not reacted to this post.'}, status=status.HTTP_400_BAD_REQUEST)
+                reaction.delete()
+                update_reaction_counters(post.pk, removed=reaction.reaction)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
         reaction_type = request.data.get('reaction')
 
         if reaction_type not in ['like', 'dislike']:
             return Response({'error': 'Invalid reaction'}, status=status.HTTP_400_BAD_REQUEST)
 
-        obj, created = PostReaction.objects.update_or_create(
-            user=request.user,
-            post=post,
-            defaults={'reaction': reaction_type}
-        )
+        with transaction.atomic():
+            obj, created = PostReaction.objects.select_for_update().get_or_create(
+                user=request.user,
+                post=post,
+                defaults={'reaction': reaction_type}
+            )
+            if created:
+                update_reaction_counters(post.pk, added=reaction_type)
+            elif obj.reaction != reaction_type:
+                previous = obj.reaction
+                obj.reaction = reaction_type
+                obj.save(update_fields=['reaction', 'updated_at'])
+                update_reaction_counters(post.pk, added=reaction_type, removed=previous)
 
         serializer = self.get_serializer(obj)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -98,7 +166,7 @@ class PostViewSet(
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def comment(self, request, pk=None):
         post = self.get_object()
-        serializer = CommentSerializer(data=request.data)
+        serializer = CommentSerializer(data=request.data, context={'request': request, 'post': post})
         if serializer.is_valid():
             serializer.save(author=request.user, post=post)
             return Response(
@@ -112,10 +180,42 @@ class PostViewSet(
 
     @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
     def comments(self, request, pk=None):
+        return self.anonymous_cached(request, self.render_comments)
+
+    async def acomments(self, request, pk=None):
+        return await sync_to_async(self.anonymous_cached)(request, self.render_comments)
+
+    def render_comments(self):
+        post = self.get_object()
+        comments = (
+            post.comments.filter(parent__isnull=True).select_related('author').defer('search_vector')
+            .order_by('-created_at', '-id')
+        )
+        page = attach_replies(self.paginate_queryset(comments))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True, methods=['get'], permission_classes=[permissions.AllowAny],
+        url_path=r'comments/(?P<comment_id>\d+)/replies', url_name='comment-replies',
+    )
+    def comment_replies(self, request, pk=None, comment_id=None):
+        return self.anonymous_cached(request, partial(self.render_replies, comment_id))
+
+    def render_replies(self, comment_id):
         post = self.get_object()
-        comments = post.comments.order_by('-created_at')
-        serializer = self.get_serializer(comments, many=True)
-        return Response(serializer.data)
+        comment = get_object_or_404(post.comments.filter(parent__isnull=True), pk=comment_id)
+        try:
+            after = int(self.request.query_params['after']) if 'after' in self.request.query_params else None
+        except ValueError:
+            raise ValidationError({'after': 'A valid integer is required.'})
+        replies, next_after = thread_replies_page(comment, after=after)
+        next_url = None
+        if next_after is not None:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'after', next_after)
+        return Response({
+            'next': next_url, 'previous': None, 'results': self.get_serializer(replies, many=True).data,
+        })
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -129,7 +229,7 @@ class PostViewSet(
     
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def favorites(self, request):
-        favorites = FavoritePost.objects.filter(user=request.user).select_related('post')
+        favorites = FavoritePost.objects.filter(user=request.user).select_related('post__author')
         posts = [fav.post for fav in favorites]
         serializer = PostSerializer(posts, many=True, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
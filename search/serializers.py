@@ -0,0 +1,28 @@
+from rest_framework import serializers
+
+from chat.models import GroupMessage
+from posts.models import Comment
+
+
+class CommentSearchSerializer(serializers.ModelSerializer):
+    author = serializers.ReadOnlyField(source='author.username')
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'post', 'author', 'text', 'created_at']
+
+
+class GroupMessageSearchSerializer(serializers.ModelSerializer):
+    sender_username = serializers.CharField(source='sender.username', read_only=True)
+
+    class Meta:
+        model = GroupMessage
+        fields = ['id', 'group', 'sender_username', 'content', 'created_at']
+
+
+class UserSearchSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    first_name = serializers.CharField()
+    last_name = serializers.CharField()
+    is_friend = serializers.BooleanField()
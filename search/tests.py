@@ -0,0 +1,143 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from chat.models import DirectMessage, Group, GroupMessage
+from friends.models import Friend
+from posts.models import Comment, Post
+from users.models import Block
+from users.utils import get_block_ids
+
+User = get_user_model()
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com', password='pass')
+        self.client.force_authenticate(self.alice)
+
+    def search(self, name, text):
+        response = self.client.get(reverse(f'{name}-list'), {'q': text})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def test_posts_are_ranked_and_respect_visibility(self):
+        Post.objects.create(author=self.bob, title='Hiking notes', description='a long hike in the mountains')
+        Post.objects.create(author=self.bob, title='Mountains', description='mountains, mountains everywhere')
+        Post.objects.create(author=self.bob, title='Secret mountains', visibility='friends')
+        Post.objects.create(author=self.carol, title='Private mountains', visibility='private')
+
+        results = self.search('search-posts', 'mountains')
+        self.assertEqual([p['title'] for p in results], ['Mountains', 'Hiking notes'])
+
+        Friend.objects.create(user=self.alice, friend=self.bob)
+        cache.clear()
+        self.assertIn('Secret mountains', [p['title'] for p in self.search('search-posts', 'mountains')])
+
+    def test_vectors_follow_edits(self):
+        post = Post.objects.create(author=self.bob, title='Before')
+        post.title = 'After'
+        post.save()
+        self.assertEqual(self.search('search-posts', 'before'), [])
+        self.assertEqual(len(self.search('search-posts', 'after')), 1)
+
+    def test_blocked_authors_are_hidden(self):
+        post = Post.objects.create(author=self.alice, title='Sunset')
+        Comment.objects.create(post=post, author=self.bob, text='great sunset')
+        Post.objects.create(author=self.bob, title='Sunset again')
+        Block.objects.create(blocker=self.alice, blocked=self.bob)
+        cache.clear()
+
+        self.assertEqual([p['title'] for p in self.search('search-posts', 'sunset')], ['Sunset'])
+        self.assertEqual(self.search('search-comments', 'sunset'), [])
+
+    def test_blocked_users_messages_are_hidden(self):
+        DirectMessage.objects.create(sender=self.bob, recipient=self.alice, message='sunset walk?')
+        DirectMessage.objects.create(sender=self.alice, recipient=self.bob, message='sunset sounds good')
+        DirectMessage.objects.create(sender=self.carol, recipient=self.alice, message='sunset pictures')
+        group = Group.objects.create(name='Walkers', owner=self.carol)
+        group.members.set([self.alice, self.bob, self.carol])
+        GroupMessage.objects.create(group=group, sender=self.bob, content='sunset at eight')
+        GroupMessage.objects.create(group=group, sender=self.carol, content='sunset at nine')
+        Block.objects.create(blocker=self.bob, blocked=self.alice)
+        cache.clear()
+
+        self.assertEqual([m['message'] for m in self.search('search-messages', 'sunset')], ['sunset pictures'])
+        self.assertEqual([m['content'] for m in self.search('search-group-messages', 'sunset')], ['sunset at nine'])
+
+    def test_messages_are_limited_to_participants_and_members(self):
+        DirectMessage.objects.create(sender=self.bob, recipient=self.alice, message='dinner tonight?')
+        DirectMessage.objects.create(sender=self.bob, recipient=self.carol, message='dinner tomorrow?')
+        mine = Group.objects.create(name='Mine', owner=self.bob)
+        mine.members.set([self.alice, self.bob])
+        other = Group.objects.create(name='Other', owner=self.carol)
+        other.members.set([self.carol, self.bob])
+        GroupMessage.objects.create(group=mine, sender=self.bob, content='dinner plans')
+        GroupMessage.objects.create(group=other, sender=self.carol, content='dinner plans too')
+
+        self.assertEqual([m['message'] for m in self.search('search-messages', 'dinner')], ['dinner tonight?'])
+        self.assertEqual([m['group'] for m in self.search('search-group-messages', 'dinner')], [mine.id])
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('search-messages-list'), {'q': 'dinner'}).status_code, 401)
+
+    def test_query_is_required(self):
+        response = self.client.get(reverse('search-posts-list'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_results_paginate_by_rank(self):
+        for i in range(35):
+            Post.objects.create(author=self.bob, title=f'Cats {i}', description='cats ' * (i % 3))
+        first = self.client.get(reverse('search-posts-list'), {'q': 'cats'}).data
+        second = self.client.get(first['next']).data
+        ids = [p['id'] for p in first['results'] + second['results']]
+        self.assertEqual(len(ids), 35)
+        self.assertEqual(len(set(ids)), 35)
+        self.assertIsNone(second['next'])
+
+
+class UserSearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass')
+        self.alex = User.objects.create_user(username='alexander', email='alex@example.com', password='pass')
+        self.albert = User.objects.create_user(username='albert', email='albert@example.com', password='pass')
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', password='pass', first_name='Alfred', last_name='Stone'
+        )
+        self.client.force_authenticate(self.alice)
+
+    def search(self, text, **params):
+        response = self.client.get(reverse('search-users-list'), {'q': text, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['username'] for row in response.data]
+
+    def test_prefix_matches_usernames_and_names_but_not_self(self):
+        results = self.search('al')
+        self.assertEqual(set(results), {'alexander', 'albert', 'bob'})
+
+    def test_friends_rank_first(self):
+        Friend.objects.create(user=self.alice, friend=self.bob)
+        cache.clear()
+        results = self.search('al')
+        self.assertEqual(results[0], 'bob')
+        self.assertEqual(self.client.get(reverse('search-users-list'), {'q': 'al'}).data[0]['is_friend'], True)
+
+    def test_blocked_users_are_excluded(self):
+        Block.objects.create(blocker=self.albert, blocked=self.alice)
+        cache.clear()
+        self.assertNotIn('albert', self.search('alb'))
+
+    def test_short_queries_return_nothing(self):
+        self.assertEqual(self.search('a'), [])
+
+    def test_friends_and_strangers_come_from_one_query(self):
+        Friend.objects.create(user=self.alice, friend=self.bob)
+        get_block_ids(self.alice)
+        with self.assertNumQueries(1):
+            results = self.search('AL', limit=2)
+        self.assertEqual(results, ['bob', 'albert'])
@@ -0,0 +1,14 @@
+from rest_framework.routers import DefaultRouter
+from .views import (
+    PostSearchViewSet, CommentSearchViewSet,
+    DirectMessageSearchViewSet, GroupMessageSearchViewSet, UserSearchViewSet,
+)
+
+router = DefaultRouter()
+router.register('search/posts', PostSearchViewSet, basename='search-posts')
+router.register('search/comments', CommentSearchViewSet, basename='search-comments')
+router.register('search/messages', DirectMessageSearchViewSet, basename='search-messages')
+router.register('search/group-messages', GroupMessageSearchViewSet, basename='search-group-messages')
+router.register('search/users', UserSearchViewSet, basename='search-users')
+
+urlpatterns = router.urls
@@ -0,0 +1,109 @@
+from django.db.models import Q
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import mixins, permissions, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from chat.models import DirectMessage, GroupMessage
+from chat.serializers import DirectMessageSerializer
+from posts.models import Comment
+from posts.serializers import PostSerializer
+from posts.utils import visible_posts
+from users.utils import get_block_ids, search_users, USER_SEARCH_MIN_LENGTH
+from narma.utils.pagination import RankCursorPagination
+from narma.utils.search import ranked_search
+from .serializers import CommentSearchSerializer, GroupMessageSearchSerializer, UserSearchSerializer
+
+query_parameter = openapi.Parameter(
+    'q', openapi.IN_QUERY, description="Search text; supports \"quoted phrases\", OR and -exclusions",
+    type=openapi.TYPE_STRING, required=True,
+)
+
+
+class SearchViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Ranked full-text search over the rows returned by ``get_search_queryset``."""
+    pagination_class = RankCursorPagination
+
+    def get_search_text(self):
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        return text
+
+    def get_search_queryset(self):
+        """Rows to search; the view's ``queryset`` unless a subclass narrows it per request."""
+        return super().get_queryset()
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return self.get_serializer_class().Meta.model.objects.none()
+        return ranked_search(self.get_search_queryset(), self.get_search_text())
+
+    @swagger_auto_schema(manual_parameters=[query_parameter])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class PostSearchViewSet(SearchViewSet):
+    serializer_class = PostSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_search_queryset(self):
+        return visible_posts(self.request.user).select_related('author')
+
+
+class CommentSearchViewSet(SearchViewSet):
+    serializer_class = CommentSearchSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_search_queryset(self):
+        user = self.request.user
+        queryset = Comment.objects.filter(post__in=visible_posts(user))
+        if user.is_authenticated:
+            queryset = queryset.exclude(author_id__in=get_block_ids(user))
+        return queryset.select_related('author')
+
+
+class DirectMessageSearchViewSet(SearchViewSet):
+    serializer_class = DirectMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_search_queryset(self):
+        user = self.request.user
+        blocked_ids = get_block_ids(user)
+        return DirectMessage.objects.filter(Q(sender=user) | Q(recipient=user)).exclude(
+            Q(sender_id__in=blocked_ids) | Q(recipient_id__in=blocked_ids)
+        )
+
+
+class GroupMessageSearchViewSet(SearchViewSet):
+    serializer_class = GroupMessageSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_search_queryset(self):
+        user = self.request.user
+        return GroupMessage.objects.filter(
+            group__in=user.group_memberships.values('id')
+        ).exclude(sender_id__in=get_block_ids(user)).select_related('sender')
+
+
+class UserSearchViewSet(viewsets.GenericViewSet):
+    """Username / name autocomplete; returns the best ``limit`` matches without pagination."""
+    serializer_class = UserSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+    max_limit = 20
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description=f"At least {USER_SEARCH_MIN_LENGTH} characters of a username or name",
+                          type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ])
+    def list(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        results = search_users(request.user, request.query_params.get('q', ''), limit=max(limit, 1))
+        return Response(self.get_serializer(results, many=True).data)
@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from chat.models import Conversation, DirectMessage, Group, GroupMessage
+from chat.utils import invalidate_group_members
+from friends.models import Friend, FriendRequest
+from friends.utils import invalidate_friend_ids
+from narma.utils.response_cache import bump_generation
+from posts.models import Comment, FavoritePost, Post, PostReaction
+from posts.utils import comment_count_subquery, recount_reactions
+from .models import Block, DataExport, EmailVerificationCode
+from .utils import invalidate_block_ids
+
+User = get_user_model()
+
+DELETION_BATCH_SIZE = 1000
+
+
+def request_account_deletion(user):
+    """Disable ``user`` right away: logins and existing tokens stop working and the public profile disappears."""
+    user.is_active = False
+    user.deletion_requested_at = timezone.now()
+    user.save(update_fields=['is_active', 'deletion_requested_at', 'updated_at'])
+    EmailVerificationCode.objects.filter(user=user).delete()
+    bump_generation('profiles')
+
+
+def _batches(queryset, fields, batch_size):
+    while True:
+        rows = list(queryset.order_by().values_list(*fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+
+
+def _delete_in_batches(queryset, batch_size, on_batch=None):
+    """Delete ``queryset`` ``batch_size`` rows per transaction; ``on_batch`` gets the affected post ids, if any."""
+    fields = ('pk', 'post_id') if on_batch else ('pk',)
+    for rows in _batches(queryset, fields, batch_size):
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            if on_batch:
+                on_batch({row[1] for row in rows})
+
+
+def purge_user(user_id, batch_size=DELETION_BATCH_SIZE):
+    """Delete everything a user left behind in bounded transactions, then the user row itself.
+
+    Child rows go first so the final cascade has nothing large left to collect, and counters on other
+    people's posts are repaired as the user's reactions and comments disappear.
+    """
+    friend_ids = set(Friend.objects.filter(friend_id=user_id).values_list('user_id', flat=True))
+    block_ids = set(Block.objects.filter(blocked_id=user_id).values_list('blocker_id', flat=True)) | set(
+        Block.objects.filter(blocker_id=user_id).values_list('blocked_id', flat=True)
+    )
+    group_ids = set(Group.members.through.objects.filter(user_id=user_id).values_list('group_id', flat=True))
+    others_posts = Post.objects.exclude(author_id=user_id)
+
+    def recount_reactions_of(post_ids):
+        recount_reactions(others_posts.filter(pk__in=post_ids))
+
+    def recount_comments_of(post_ids):
+        others_posts.filter(pk__in=post_ids).update(comments_count=comment_count_subquery(), updated_at=timezone.now())
+
+    _delete_in_batches(
+        PostReaction.objects.filter(Q(user_id=user_id) | Q(post__author_id=user_id)), batch_size, recount_reactions_of,
+    )
+    _delete_in_batches(
+        Comment.objects.filter(Q(author_id=user_id) | Q(post__author_id=user_id)), batch_size, recount_comments_of,
+    )
+    _delete_in_batches(FavoritePost.objects.filter(Q(user_id=user_id) | Q(post__author_id=user_id)), batch_size)
+    _delete_in_batches(Post.objects.filter(author_id=user_id), batch_size)
+
+    Conversation.objects.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id)).delete()
+    _delete_in_batches(DirectMessage.objects.filter(Q(sender_id=user_id) | Q(recipient_id=user_id)), batch_size)
+    _delete_in_batches(GroupMessage.objects.filter(Q(sender_id=user_id) | Q(group__owner_id=user_id)), batch_size)
+    for rows in _batches(Group.objects.filter(owner_id=user_id), ('pk',), batch_size):
+        owned_group_ids = [row[0] for row in rows]
+        with transaction.atomic():
+            Group.objects.filter(pk__in=owned_group_ids).delete()
+            invalidate_group_members(*owned_group_ids)
+
+    _delete_in_batches(Friend.objects.filter(Q(user_id=user_id) | Q(friend_id=user_id)), batch_size)
+    _delete_in_batches(FriendRequest.objects.filter(Q(from_user_id=user_id) | Q(to_user_id=user_id)), batch_size)
+    _delete_in_batches(Block.objects.filter(Q(blocker_id=user_id) | Q(blocked_id=user_id)), batch_size)
+
+    for export in DataExport.objects.filter(user_id=user_id).exclude(file=''):
+        export.file.delete(save=False)
+    User.objects.filter(pk=user_id).delete()
+
+    invalidate_friend_ids(user_id, *friend_ids)
+    invalidate_block_ids(user_id, *block_ids)
+    invalidate_group_members(*group_ids)
+    bump_generation('posts', 'profiles')
@@ -0,0 +1,52 @@
+import json
+import secrets
+import tempfile
+import zipfile
+
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+
+from bulk.exporters import export_ndjson
+from friends.models import Friend
+from .models import Block
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _profile(user):
+    return {
+        'id': user.pk,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_joined': user.date_joined,
+        'profile_picture': user.profile_picture.name if user.profile_picture else None,
+        'friends': list(
+            Friend.objects.filter(user=user).order_by('pk')
+            .values_list('friend__username', flat=True).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        ),
+        'blocked': list(
+            Block.objects.filter(blocker=user).order_by('pk')
+            .values_list('blocked__username', flat=True).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        ),
+    }
+
+
+def write_data_export(user, fileobj):
+    """Write ``user``'s data to ``fileobj`` as a ZIP: ``profile.json`` and an ``activity.ndjson`` streamed row by row."""
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('profile.json', json.dumps(_profile(user), cls=DjangoJSONEncoder, indent=2))
+        with archive.open('activity.ndjson', 'w') as activity:
+            for line in export_ndjson(user):
+                activity.write(line.encode())
+
+
+def build_data_export(export):
+    """Build the archive in a temporary file and store it under an unguessable name in media storage."""
+    with tempfile.TemporaryFile() as buffer:
+        write_data_export(export.user, buffer)
+        buffer.seek(0)
+        export.file.save(f'{export.user_id}/{secrets.token_urlsafe(24)}.zip', File(buffer), save=False)
+    export.status = 'ready'
+    export.save(update_fields=['file', 'status', 'updated_at'])
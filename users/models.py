@@ -1,4 +1,5 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from narma.model_utils.models import TimeStampedModel
 from datetime import timedelta
@@ -7,6 +8,17 @@ from django.utils import timezone
 class User(AbstractUser, TimeStampedModel):
     email = models.EmailField(unique=True)
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            GinIndex(
+                fields=['username', 'first_name', 'last_name'],
+                opclasses=['gin_trgm_ops', 'gin_trgm_ops', 'gin_trgm_ops'],
+                name='user_name_trgm',
+            ),
+        ]
 
     def __str__(self):
         return self.username
@@ -39,4 +51,18 @@ class Block(TimeStampedModel):
         unique_together = ('blocker', 'blocked')
 
     def __str__(self):
-        return f"{self.blocker} blocked {self.blocked}"
\ No newline at end of file
+        return f"{self.blocker} blocked {self.blocked}"
+
+
+class DataExport(TimeStampedModel):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_exports')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='exports/', blank=True)
+
+    def __str__(self):
+        return f"{self.user} export ({self.status})"
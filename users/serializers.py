@@ -1,22 +1,54 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from django.contrib.auth.hashers import make_password
 from narma.utils.image_validators import validate_image_size, validate_image_resolution
-from .models import Block
+from narma.utils.image_variants import variant_urls
+from .models import Block, DataExport
+from .utils import can_authenticate, invalidate_block_ids
+from friends.utils import invalidate_friendship, sever_relationship
+from django.db import transaction
+from posts.tasks import disconnect_timelines
+from .tasks import process_profile_picture
 User = get_user_model()
 
+class AccountTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuse to refresh tokens of accounts that were deactivated or scheduled for deletion meanwhile."""
+
+    def validate(self, attrs):
+        user_id = RefreshToken(attrs['refresh']).get(jwt_settings.USER_ID_CLAIM)
+        user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).first()
+        if not can_authenticate(user):
+            raise AuthenticationFailed("No active account found for this token.", code='no_active_account')
+        return super().validate(attrs)
+
+
 class UserSerializer(serializers.ModelSerializer):
     profile_picture = serializers.ImageField(read_only=True)
+    profile_picture_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'profile_picture')
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'profile_picture', 'profile_picture_variants')
+
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj.profile_picture_variants, self.context.get('request'))
+
+
+class ProfileSerializer(UserSerializer):
+    """The signed-in user's own profile; username and email have their own confirmation flows."""
+
+    class Meta(UserSerializer.Meta):
+        read_only_fields = ('username', 'email')
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -52,6 +84,8 @@ class RegisterSerializer(serializers.ModelSerializer):
 
         user.is_active = False
         user.save()
+        if profile_picture:
+            transaction.on_commit(lambda: process_profile_picture.delay(user.id))
         return user
 
 
@@ -103,6 +137,9 @@ class EmailCodeResendSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError({"message": "User with this email not found"})
 
+        if user.deletion_requested_at is not None:
+            raise serializers.ValidationError({"message": "This account is being deleted"})
+
         if user.is_active:
             raise serializers.ValidationError({"message": "User is already active"})
 
@@ -120,7 +157,7 @@ class EmailCodeConfirmSerializer(serializers.Serializer):
         code = attrs['code']
 
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get(email=email, deletion_requested_at__isnull=True)
             verification_code = EmailVerificationCode.objects.get(user=user)
 
             if verification_code.code != code:
@@ -196,9 +233,14 @@ class BlockUserSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError("User does not exist.")
         
-        block, created = Block.objects.get_or_create(blocker=blocker, blocked=blocked_user)
-        if not created:
-            raise serializers.ValidationError("User is already blocked.")
+        with transaction.atomic():
+            block, created = Block.objects.get_or_create(blocker=blocker, blocked=blocked_user)
+            if not created:
+                raise serializers.ValidationError("User is already blocked.")
+            sever_relationship(blocker, blocked_user)
+        invalidate_block_ids(blocker, blocked_user)
+        invalidate_friendship(blocker, blocked_user)
+        transaction.on_commit(lambda: disconnect_timelines.delay(blocker.id, blocked_user.id))
         return [block]
 
 
@@ -220,6 +262,7 @@ class UnblockUserSerializer(serializers.Serializer):
         try:
             block = Block.objects.get(blocker=request_user, blocked=blocked_user)
             block.delete()
+            invalidate_block_ids(request_user, blocked_user)
             return {"detail": f"User '{blocked_user.username}' successfully unblocked."}
         except Block.DoesNotExist:
             raise serializers.ValidationError("This user is not blocked.")
@@ -231,3 +274,10 @@ class BlockListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Block
         fields = ['id', 'blocked']
+
+
+class DataExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DataExport
+        fields = ['id', 'status', 'file', 'created_at']
+        read_only_fields = fields
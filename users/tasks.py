@@ -1,6 +1,125 @@
+import smtplib
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.signals import worker_process_shutdown
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import DatabaseError
+from django.utils import timezone
+
+from narma.utils.image_variants import build_image_variants
+from narma.utils.response_cache import bump_generation
+from .deletion import purge_user
+from .exports import build_data_export
+from .models import DataExport
+
+DEFAULT_PROFILE_PICTURE = 'profiles/default.jpg'
+NO_REPLY_EMAIL = 'no-reply@example.com'
+MAIL_RETRY_ERRORS = (smtplib.SMTPException, OSError)
+MAIL_MAX_RETRIES = 5
+MAIL_RETRY_BACKOFF_MAX = 600
+DATA_EXPORT_TTL = timedelta(days=7)
+ACCOUNT_DELETION_MAX_RETRIES = 5
+# Deletions still pending after this long lost their task (or ran out of retries) and are queued again.
+ACCOUNT_DELETION_RESUME_AFTER = timedelta(hours=1)
+
+_mail_connection = None
+
+
+def get_mail_connection():
+    """Return the worker's open mail connection, reused across tasks to skip the SMTP/TLS handshake."""
+    global _mail_connection
+    if _mail_connection is None:
+        connection = get_connection()
+        connection.open()
+        _mail_connection = connection
+    return _mail_connection
+
+
+def reset_mail_connection():
+    global _mail_connection
+    if _mail_connection is not None:
+        try:
+            _mail_connection.close()
+        except MAIL_RETRY_ERRORS:
+            pass
+    _mail_connection = None
+
+
+@worker_process_shutdown.connect
+def close_mail_connection(**kwargs):
+    reset_mail_connection()
+
+
+def deliver_email(task, subject, message, recipient_email):
+    email = EmailMessage(subject, message, NO_REPLY_EMAIL, [recipient_email])
+    try:
+        try:
+            get_mail_connection().send_messages([email])
+        except smtplib.SMTPServerDisconnected:
+            # The server closed the idle connection we kept open; reconnect once before backing off.
+            reset_mail_connection()
+            get_mail_connection().send_messages([email])
+    except MAIL_RETRY_ERRORS as exc:
+        reset_mail_connection()
+        countdown = min(10 * 2 ** task.request.retries, MAIL_RETRY_BACKOFF_MAX)
+        raise task.retry(exc=exc, countdown=countdown)
+
+
+@shared_task(bind=True, max_retries=MAIL_MAX_RETRIES)
+def send_email_async(self, subject, message, recipient_email):
+    deliver_email(self, subject, message, recipient_email)
+
+
+@shared_task
+def process_profile_picture(user_id):
+    User = get_user_model()
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return
+    if not user.profile_picture or user.profile_picture.name == DEFAULT_PROFILE_PICTURE:
+        return
+    variants = build_image_variants(user.profile_picture, old_variants=user.profile_picture_variants)
+    User.objects.filter(pk=user_id, profile_picture=user.profile_picture.name).update(
+        profile_picture_variants=variants, updated_at=timezone.now()
+    )
+    bump_generation('profiles')
+
+
+@shared_task(autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=ACCOUNT_DELETION_MAX_RETRIES)
+def delete_account(user_id):
+    User = get_user_model()
+    if User.objects.filter(pk=user_id, deletion_requested_at__isnull=False).exists():
+        purge_user(user_id)
+
+
+@shared_task
+def resume_account_deletions():
+    """Queue again deletions that are still pending; ``purge_user`` continues where the last run stopped."""
+    User = get_user_model()
+    stale = User.objects.filter(deletion_requested_at__lt=timezone.now() - ACCOUNT_DELETION_RESUME_AFTER)
+    for user_id in stale.values_list('pk', flat=True):
+        delete_account.delay(user_id)
+
+
+@shared_task
+def generate_data_export(export_id):
+    try:
+        export = DataExport.objects.select_related('user').get(pk=export_id, status='pending')
+    except DataExport.DoesNotExist:
+        return
+    try:
+        build_data_export(export)
+    except Exception:
+        DataExport.objects.filter(pk=export_id).update(status='failed', updated_at=timezone.now())
+        raise
+
 
 @shared_task
-def send_email_async(subject, message, recipient_email):
-    send_mail(subject, message, 'no-reply@example.com', [recipient_email])
\ No newline at end of file
+def purge_expired_data_exports():
+    expired = DataExport.objects.filter(created_at__lt=timezone.now() - DATA_EXPORT_TTL)
+    for export in expired.exclude(file='').iterator():
+        export.file.delete(save=False)
+    expired.delete()
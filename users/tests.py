@@ -5,9 +5,29 @@ from django.contrib.auth import get_user_model
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
-from users.models import EmailVerificationCode
+from users.models import EmailVerificationCode, Block
+from users.utils import is_blocked, blocked_among
+from django.core.cache import cache
+from django.core import mail
+from unittest import mock
+from users import tasks
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from users.deletion import purge_user, request_account_deletion
+from users.models import DataExport
+from chat.models import DirectMessage, Group, GroupMessage
+from chat.utils import get_group_member_ids
+from friends.models import Friend
+from friends.utils import get_friend_ids
+from posts.models import Post, PostReaction
+from posts.utils import add_comment
+import json
+import tempfile
+import zipfile
+from users.tasks import send_email_async
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
+from datetime import timedelta
 from io import BytesIO
 
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -16,6 +36,10 @@ User = get_user_model()
 
 class UserFlowTests(APITestCase):
     def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
         self.register_url = reverse('user-registration-list')
         self.login_url = reverse('token_obtain_pair')
         self.user_list_url = reverse('user-list')
@@ -82,11 +106,119 @@ class UserFlowTests(APITestCase):
         url = reverse('profile-delete-account', kwargs={"username": user.username})
         response = self.client.post(url, data={"password": "wrongpass"})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        response = self.client.post(url, data={"password": "pass1234"})
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with mock.patch.object(tasks.delete_account, 'delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data={"password": "pass1234"})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(user.pk)
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertIsNotNone(user.deletion_requested_at)
+        self.assertEqual(self.client.get(reverse('profile-detail', kwargs={"username": user.username})).status_code, 404)
+
+        tasks.delete_account(user.pk)
         with self.assertRaises(User.DoesNotExist):
             User.objects.get(pk=user.pk)
 
+    def test_account_pending_deletion_cannot_be_revived(self):
+        user = User.objects.create_user(username="leaving", email="leaving@example.com", password="pass1234")
+        refresh = str(RefreshToken.for_user(user))
+        request_account_deletion(user)
+        EmailVerificationCode.objects.create(user=user, code="123456", created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.client.post(self.resend_code_url, data={"email": user.email})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.confirm_code_url, data={"email": user.email, "code": "123456"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+
+        User.objects.filter(pk=user.pk).update(is_active=True)
+        response = self.client.post(self.login_url, data={"username": "leaving", "password": "pass1234"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), data={"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stale_account_deletions_are_queued_again(self):
+        stale = User.objects.create_user(username="stale", email="stale@example.com", password="pass1234")
+        fresh = User.objects.create_user(username="fresh", email="fresh@example.com", password="pass1234")
+        request_account_deletion(stale)
+        request_account_deletion(fresh)
+        User.objects.filter(pk=stale.pk).update(deletion_requested_at=timezone.now() - timedelta(hours=2))
+
+        with mock.patch.object(tasks.delete_account, 'delay') as delay:
+            tasks.resume_account_deletions()
+        delay.assert_called_once_with(stale.pk)
+
+    def test_account_purge_deletes_in_batches_and_repairs_counters(self):
+        user = User.objects.create_user(username="leaving", email="leaving@example.com", password="pass1234")
+        other = User.objects.create_user(username="staying", email="staying@example.com", password="pass1234")
+        other_post = Post.objects.create(author=other, title="Stays")
+        own_post = Post.objects.create(author=user, title="Goes")
+        for i in range(5):
+            Post.objects.create(author=user, title=f"Goes {i}")
+        PostReaction.objects.create(post=other_post, user=user, reaction='like')
+        PostReaction.objects.create(post=own_post, user=other, reaction='like')
+        add_comment(other_post, user, "bye")
+        add_comment(own_post, other, "hi")
+        Post.objects.filter(pk=other_post.pk).update(likes_count=1)
+        Friend.objects.create(user=user, friend=other)
+        Friend.objects.create(user=other, friend=user)
+        DirectMessage.objects.create(sender=other, recipient=user, message="hello")
+        group = Group.objects.create(name="Mine", owner=user)
+        group.members.add(user, other)
+        GroupMessage.objects.create(group=group, sender=other, content="hey")
+        joined = Group.objects.create(name="Theirs", owner=other)
+        joined.members.add(user, other)
+        self.assertEqual(get_friend_ids(other), {user.pk})
+        self.assertEqual(get_group_member_ids(group.pk), {user.pk, other.pk})
+        self.assertEqual(get_group_member_ids(joined.pk), {user.pk, other.pk})
+
+        request_account_deletion(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            purge_user(user.pk, batch_size=2)
+
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertEqual(list(Post.objects.values_list('title', flat=True)), ["Stays"])
+        other_post.refresh_from_db()
+        self.assertEqual((other_post.likes_count, other_post.comments_count), (0, 0))
+        self.assertFalse(DirectMessage.objects.exists())
+        self.assertEqual(list(Group.objects.all()), [joined])
+        self.assertEqual(get_group_member_ids(group.pk), set())
+        self.assertEqual(get_group_member_ids(joined.pk), {other.pk})
+        self.assertEqual(get_friend_ids(other), set())
+
+    def test_data_export_is_built_in_background_and_served_from_media(self):
+        user = User.objects.create_user(username="exporter", email="exporter@example.com", password="pass1234")
+        other = User.objects.create_user(username="pal", email="pal@example.com", password="pass1234")
+        Friend.objects.create(user=user, friend=other)
+        Post.objects.create(author=user, title="My post")
+        DirectMessage.objects.create(sender=user, recipient=other, message="secret")
+        self.client.force_authenticate(user)
+        url = reverse('profile-export-data', kwargs={"username": user.username})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        with mock.patch.object(tasks.generate_data_export, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        export = DataExport.objects.get(user=user)
+        delay.assert_called_once_with(export.pk)
+        tasks.generate_data_export(export.pk)
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['status'], 'ready')
+        self.assertIn('/media/exports/', response.data['file'])
+        export.refresh_from_db()
+        with zipfile.ZipFile(export.file.path) as archive:
+            profile = json.loads(archive.read('profile.json'))
+            activity = [json.loads(line) for line in archive.read('activity.ndjson').splitlines()]
+        self.assertEqual(profile['friends'], ["pal"])
+        self.assertEqual([record['type'] for record in activity], ['post', 'direct_message'])
+
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.post(url).status_code, 403)
+
     def test_change_username(self):
         user = User.objects.create_user(
             username="oldusername",
@@ -127,3 +259,103 @@ class UserFlowTests(APITestCase):
 
         user.refresh_from_db()
         self.assertIn("test_image", user.profile_picture.name)
+
+    def test_block_cache_follows_block_and_unblock(self):
+        user = User.objects.create_user(username="blocker", email="blocker@example.com", password="pass1234")
+        other = User.objects.create_user(username="blocked", email="blocked@example.com", password="pass1234")
+        bystander = User.objects.create_user(username="bystander", email="bystander@example.com", password="pass1234")
+        self.assertFalse(is_blocked(other, user))
+
+        self.client.force_authenticate(user)
+        self.client.post(reverse('blocks-list'), data={"blocked_username": "blocked"})
+
+        self.assertTrue(is_blocked(other, user))
+        self.assertEqual(blocked_among(user, [other.id, bystander.id]), {other.id})
+        with self.assertNumQueries(0):
+            self.assertTrue(is_blocked(user, other))
+            self.assertEqual(blocked_among(other, [user.id, bystander.id]), {user.id})
+
+        self.client.post(reverse('blocks-unblock'), data={"username": "blocked"})
+
+        self.assertFalse(is_blocked(user, other))
+        self.assertFalse(is_blocked(other, user))
+
+    def test_public_profile_supports_conditional_get(self):
+        user = User.objects.create_user(username="etaguser", email="etag@example.com", password="pass1234")
+        self.client.force_authenticate(user)
+        url = reverse('profile-detail', kwargs={"username": user.username})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        User.objects.filter(pk=user.pk).update(first_name="Changed", updated_at=user.updated_at + timedelta(seconds=1))
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.data['first_name'], "Changed")
+
+    def test_anonymous_public_profile_is_cached_until_profile_changes(self):
+        user = User.objects.create_user(username="cacheduser", email="cached@example.com", password="pass1234")
+        url = reverse('profile-detail', kwargs={"username": user.username})
+        first = self.client.get(url)
+
+        User.objects.filter(pk=user.pk).update(first_name="Stale")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, first.data)
+
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('my-profile'), data={"first_name": "Fresh", "username": "hijacked"}, format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(None)
+        refreshed = self.client.get(url)
+        self.assertEqual(refreshed.data['first_name'], "Fresh")
+        self.assertEqual(refreshed.data['username'], "cacheduser")
+
+        self.client.force_authenticate(user)
+        with mock.patch.object(tasks.process_profile_picture, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('profile-update-image', kwargs={"username": user.username}),
+                data={"profile_picture": self.get_test_image_file()}, format='multipart',
+            )
+        delay.assert_called_once_with(user.pk)
+        self.client.force_authenticate(None)
+        self.assertIn("test_image", self.client.get(url).data['profile_picture'])
+
+    def test_registration_queues_verification_email(self):
+        with mock.patch.object(send_email_async, 'delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.register_url, data=self.user_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        delay.assert_called_once()
+        self.assertEqual(delay.call_args.args[2], self.user_data["email"])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_email_tasks_reuse_one_connection(self):
+        tasks.reset_mail_connection()
+        send_email_async("Subject", "Body", "one@example.com")
+        connection = tasks.get_mail_connection()
+        send_email_async("Subject", "Body", "two@example.com")
+        self.assertIs(tasks.get_mail_connection(), connection)
+        self.assertEqual([m.to[0] for m in mail.outbox], ["one@example.com", "two@example.com"])
+
+    def test_email_task_reconnects_once_when_the_server_dropped_the_connection(self):
+        tasks.reset_mail_connection()
+        stale, fresh = tasks.get_connection(), tasks.get_connection()
+        with mock.patch.object(tasks, 'get_connection', side_effect=[stale, fresh]), \
+                mock.patch.object(stale, 'send_messages', side_effect=tasks.smtplib.SMTPServerDisconnected()):
+            result = send_email_async.apply(args=("Subject", "Body", "one@example.com"))
+        self.assertEqual(result.state, 'SUCCESS')
+        self.assertIs(tasks.get_mail_connection(), fresh)
+        self.assertEqual([m.to[0] for m in mail.outbox], ["one@example.com"])
+
+    def test_email_task_retries_and_drops_connection_on_smtp_error(self):
+        tasks.reset_mail_connection()
+        connection = tasks.get_connection()
+        with mock.patch.object(tasks, 'get_connection', return_value=connection), \
+                mock.patch.object(connection, 'send_messages', side_effect=tasks.smtplib.SMTPServerDisconnected()) as send:
+            result = send_email_async.apply(args=("Subject", "Body", "one@example.com"))
+        self.assertEqual(result.state, 'FAILURE')
+        self.assertEqual(send.call_count, 2 * (tasks.MAIL_MAX_RETRIES + 1))
+        self.assertIsNone(tasks._mail_connection)
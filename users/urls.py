@@ -17,6 +17,7 @@ router.register('blocks', BlockViewSet, basename='blocks')
 
 
 urlpatterns = [
+    path('me/', ProfileViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update'}), name='my-profile'),
     path('password_reset_confirm/<uidb64>/<token>/', PasswordResetConfirmViewSet.as_view({'post': 'create'}), name='password_reset_confirm'),
     path('', include(router.urls)),
 ]
@@ -1,8 +1,83 @@
-from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from narma.db_routing import use_primary
+from narma.instrumentation import record_cache_access
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Greatest
+from friends.models import Friend
+from friends.utils import _user_id
 from .models import Block
 
+User = get_user_model()
+
+BLOCK_IDS_CACHE_KEY = 'blocks:ids:{}'
+BLOCK_IDS_CACHE_TIMEOUT = 60 * 60
+
+USER_SEARCH_MIN_LENGTH = 2
+USER_SEARCH_MAX_LENGTH = 64
+USER_SEARCH_FIELDS = ('id', 'username', 'first_name', 'last_name')
+
+
+def can_authenticate(user):
+    """Token rule for simplejwt: inactive accounts and accounts awaiting deletion get no tokens."""
+    return user is not None and user.is_active and user.deletion_requested_at is None
+
+
+def get_block_ids(user):
+    """Return ids of users that ``user`` blocked or was blocked by, loading them from the DB on a cache miss."""
+    user_id = _user_id(user)
+    key = BLOCK_IDS_CACHE_KEY.format(user_id)
+    block_ids = cache.get(key)
+    record_cache_access(block_ids is not None)
+    if block_ids is None:
+        block_ids = set()
+        with use_primary():
+            pairs = list(Block.objects.filter(
+                Q(blocker_id=user_id) | Q(blocked_id=user_id)
+            ).values_list('blocker_id', 'blocked_id'))
+        for blocker_id, blocked_id in pairs:
+            block_ids.add(blocked_id if blocker_id == user_id else blocker_id)
+        cache.set(key, block_ids, BLOCK_IDS_CACHE_TIMEOUT)
+    return block_ids
+
+
+def blocked_among(user, candidate_ids):
+    """Return the subset of ``candidate_ids`` that has a block in either direction with ``user``."""
+    return get_block_ids(user).intersection(candidate_ids)
+
+
 def is_blocked(user1, user2):
-    return Block.objects.filter(
-        Q(blocker=user1, blocked=user2) |
-        Q(blocker=user2, blocked=user1)
-    ).exists()
\ No newline at end of file
+    return _user_id(user2) in get_block_ids(user1)
+
+
+def invalidate_block_ids(*users):
+    cache.delete_many([BLOCK_IDS_CACHE_KEY.format(_user_id(user)) for user in users])
+
+
+def normalize_search_text(text):
+    return ' '.join(text.lower().split())[:USER_SEARCH_MAX_LENGTH]
+
+
+def search_users(user, text, limit=10):
+    """Match users by name for ``user``: friends first, then everyone else, never blocked users or themselves."""
+    text = normalize_search_text(text)
+    if len(text) < USER_SEARCH_MIN_LENGTH:
+        return []
+
+    hidden_ids = get_block_ids(user) | {user.pk}
+    # ``<%`` (word similarity) is served by the user_name_trgm GIN index and also
+    # matches prefixes of a name, which is what autocomplete mostly sends.
+    return list(User.objects.filter(
+        Q(username__trigram_word_similar=text) |
+        Q(first_name__trigram_word_similar=text) |
+        Q(last_name__trigram_word_similar=text),
+        is_active=True,
+    ).exclude(id__in=hidden_ids).annotate(
+        similarity=Greatest(
+            TrigramWordSimilarity(text, 'username'),
+            TrigramWordSimilarity(text, 'first_name'),
+            TrigramWordSimilarity(text, 'last_name'),
+        ),
+        is_friend=Exists(Friend.objects.filter(user_id=user.pk, friend_id=OuterRef('pk'))),
+    ).order_by('-is_friend', '-similarity', 'username').values(*USER_SEARCH_FIELDS, 'is_friend')[:limit])
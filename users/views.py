@@ -4,7 +4,6 @@ import random
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
@@ -16,18 +15,24 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.exceptions import PermissionDenied
+from narma.db_routing import ReplicaReadMixin
+from narma.utils.conditional import ConditionalGetMixin
+from narma.utils.response_cache import AnonymousResponseCacheMixin, bump_generation
 from .utils import is_blocked
+from .tasks import delete_account, generate_data_export, process_profile_picture, send_email_async
+from .deletion import request_account_deletion
+from django.db import transaction
 
 from .serializers import (
     RegisterSerializer, UserSerializer, PasswordResetSerializer, PasswordResetConfirmSerializer,
     EmailCodeConfirmSerializer, EmailCodeResendSerializer, PasswordConfirmationSerializer,
     EmailChangeRequestCodeSerializer, EmailChangeConfirmCodeSerializer, NewEmailCodeConfirmSerializer,
     UsernameChangeSerializer, ProfilePictureUpdateSerializer, BlockUserSerializer, UnblockUserSerializer,
-    BlockListSerializer
+    BlockListSerializer, DataExportSerializer, ProfileSerializer
 )
 from .permissions import IsNotAuthenticated
 from users.models import EmailVerificationCode
-from .models import Block
+from .models import Block, DataExport
 
 User = get_user_model()
 
@@ -37,7 +42,7 @@ def generate_code():
 
 
 def send_code_email(subject, message, to_email):
-    send_mail(subject, message, 'no-reply@example.com', [to_email])
+    transaction.on_commit(lambda: send_email_async.delay(subject, message, to_email))
 
 
 class RegisterViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
@@ -84,27 +89,39 @@ class RegisterViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
 
 
 class ProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMixin):
-    serializer_class = UserSerializer
+    serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
         return self.request.user
 
+    def perform_update(self, serializer):
+        serializer.save()
+        bump_generation('profiles')
 
 
-class PublicProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
-    queryset = User.objects.all()
+
+class PublicProfileViewSet(ReplicaReadMixin, AnonymousResponseCacheMixin, ConditionalGetMixin, viewsets.GenericViewSet, mixins.RetrieveModelMixin):
+    queryset = User.objects.filter(deletion_requested_at__isnull=True)
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
     lookup_field = 'username'
+    response_cache_namespaces = ('profiles',)
 
     def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_cached(request, self.render_profile)
+
+    def render_profile(self):
+        request = self.request
         user = self.get_object()
 
         if request.user.is_authenticated and is_blocked(request.user, user):
             raise PermissionDenied("You are not allowed to perform this action.")
 
-        return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, lambda: Response(self.get_serializer(user).data),
+            user.pk, user.updated_at, last_modified=user.updated_at,
+        )
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated], serializer_class=PasswordConfirmationSerializer)
     def delete_account(self, request, username=None):
@@ -117,8 +134,26 @@ class PublicProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         if not request.user.check_password(serializer.validated_data['password']):
             return Response({'password': ['Incorrect password.']}, status=400)
 
-        request.user.delete()
-        return Response({'detail': 'Account deleted successfully.'}, status=204)
+        user = request.user
+        request_account_deletion(user)
+        transaction.on_commit(lambda: delete_account.delay(user.pk))
+        return Response({'detail': 'Account disabled, your data is being deleted.'}, status=202)
+
+    @action(detail=True, methods=['get', 'post'], permission_classes=[IsAuthenticated], serializer_class=DataExportSerializer)
+    def export_data(self, request, username=None):
+        if self.get_object() != request.user:
+            return Response({"detail": "You can't export someone else's data."}, status=403)
+
+        export = DataExport.objects.filter(user=request.user).order_by('-created_at', '-id').first()
+        if request.method == 'GET':
+            if export is None:
+                return Response({"detail": "No data export requested yet."}, status=404)
+            return Response(self.get_serializer(export).data)
+
+        if export is None or export.status != 'pending':
+            export = DataExport.objects.create(user=request.user)
+            transaction.on_commit(lambda: generate_data_export.delay(export.pk))
+        return Response(self.get_serializer(export).data, status=202)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated], serializer_class=UsernameChangeSerializer)
     def change_username(self, request, username=None):
@@ -138,6 +173,7 @@ class PublicProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
 
         user.username = new_username
         user.save()
+        bump_generation('profiles', 'posts')
         return Response({'detail': 'Username changed successfully.', 'new_username': new_username}, status=200)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated], serializer_class=ProfilePictureUpdateSerializer, parser_classes=[MultiPartParser, FormParser])
@@ -153,6 +189,8 @@ class PublicProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin):
         if profile_picture:
             user.profile_picture = profile_picture
             user.save()
+            bump_generation('profiles')
+            transaction.on_commit(lambda: process_profile_picture.delay(user.id))
             return Response({'detail': 'Profile picture updated successfully.', 'data': serializer.data}, status=200)
 
         return Response({'detail': 'No profile picture provided.'}, status=400)
@@ -256,6 +294,7 @@ class EmailChangeViewSet(viewsets.GenericViewSet):
 
         user.email = evc.new_email
         user.save()
+        bump_generation('profiles')
         evc.delete()
 
         return Response({"message": "Email successfully changed ✅"}, status=200)